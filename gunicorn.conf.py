@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+"""Settings of gunicorn, loaded from the working directory"""
+
+
+def on_starting(server):
+    # The counters start again from zero
+    from pep8speaks import metrics
+    metrics.clear_directory()
+
+
+def post_worker_init(worker):
+    # Start the lint processes before the first request
+    from pep8speaks import metrics, workers
+    workers.start()
+    metrics.start_writer()
+
+
+def worker_exit(server, worker):
+    from pep8speaks import metrics, workers
+    workers.stop()
+    # The last metrics of the worker, before child_exit
+    metrics.flush()
+
+
+def child_exit(server, worker):
+    # Keep the counters of the worker, but not its gauges
+    from pep8speaks import metrics
+    metrics.mark_process_dead(worker.pid)
@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+"""
+Caches shared by the threads of the process.
+
+A Cache keeps its entries in an in-memory LRU and, optionally, in a directory
+on disk which is shared by the gunicorn workers and survives restarts. Every
+entry can have a time to live, entries without one never expire.
+"""
+from collections import OrderedDict
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+import time
+
+from pep8speaks import metrics
+
+# Returned by Cache.get for missing entries, as None can be cached
+MISSING = object()
+
+
+class LRUCache(object):
+    """
+    Least recently used entries are evicted above maxsize entries, or above
+    max_bytes bytes when given, the size of a value being given by size_of.
+    """
+    def __init__(self, maxsize, max_bytes=None, size_of=len):
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.size_of = size_of
+        self.bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _size(self, value):
+        return 0 if self.max_bytes is None else self.size_of(value)
+
+    def _pop(self, key):
+        _, value = self._entries.pop(key)
+        self.bytes -= self._size(value)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return MISSING
+            expires_at, value = entry
+            if expires_at is not None and expires_at < time.time():
+                self._pop(key)
+                return MISSING
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None, expires_at=None):
+        if ttl is not None:
+            expires_at = time.time() + ttl
+        with self._lock:
+            if key in self._entries:
+                self._pop(key)
+            self._entries[key] = (expires_at, value)
+            self.bytes += self._size(value)
+            while self._entries and (
+                    len(self._entries) > self.maxsize or (self.max_bytes is not None and self.bytes > self.max_bytes)):
+                self._pop(next(iter(self._entries)))
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+
+class DiskCache(object):
+    """
+    Entries pickled in the files of a directory.
+
+    The least recently used files are deleted when the directory grows
+    above max_bytes.
+    """
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._size = self._scan_size()
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha256(repr(key).encode()).hexdigest())
+
+    def _scan_size(self):
+        size = 0
+        for entry in os.scandir(self.directory):
+            if entry.is_file():
+                size += entry.stat().st_size
+        return size
+
+    def get_entry(self, key):
+        """Return the (expires_at, value) tuple of the key, or MISSING"""
+        path = self._path(key)
+        try:
+            with open(path, "rb") as cache_file:
+                expires_at, value = pickle.load(cache_file)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return MISSING
+        if expires_at is not None and expires_at < time.time():
+            return MISSING
+        try:
+            os.utime(path)  # Mark as recently used
+        except OSError:
+            pass
+        return expires_at, value
+
+    def get(self, key):
+        entry = self.get_entry(key)
+        return entry if entry is MISSING else entry[1]
+
+    def set(self, key, value, ttl=None):
+        expires_at = None if ttl is None else time.time() + ttl
+        data = pickle.dumps((expires_at, value), protocol=pickle.HIGHEST_PROTOCOL)
+        # Write in a temporary file first, so that readers never see a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as cache_file:
+            cache_file.write(data)
+        path = self._path(key)
+        try:
+            replaced = os.stat(path).st_size
+        except OSError:
+            replaced = 0
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._size += len(data) - replaced
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # Other processes write in the directory too, so look at what is really there
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".tmp"):
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+        entries.sort()
+
+        size = sum(file_size for _, file_size, _ in entries)
+        for _, file_size, path in entries:
+            if size <= self.max_bytes * 0.9:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            size -= file_size
+        self._size = size
+
+    def clear(self):
+        with self._lock:
+            for entry in os.scandir(self.directory):
+                if entry.is_file():
+                    os.remove(entry.path)
+            self._size = 0
+
+
+class Cache(object):
+    """
+    An in-memory LRU in front of an optional disk cache.
+
+    Hits and misses are counted in the cache_requests_total metric, and in
+    the hits and misses attributes. The memory is bounded by maxsize entries,
+    and by memory_bytes when given (see LRUCache), the disk by max_bytes.
+    """
+    def __init__(self, name, maxsize, directory=None, max_bytes=None, memory_bytes=None, size_of=len):
+        self.name = name
+        self.memory = LRUCache(maxsize, memory_bytes, size_of)
+        self.disk = None
+        if directory:
+            self.disk = DiskCache(os.path.join(directory, name), max_bytes)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        value = self.memory.get(key)
+        if value is MISSING and self.disk is not None:
+            entry = self.disk.get_entry(key)
+            if entry is not MISSING:
+                expires_at, value = entry
+                self.memory.set(key, value, expires_at=expires_at)
+
+        if value is MISSING:
+            self.misses += 1
+            metrics.inc("cache_requests_total", cache=self.name, result="miss")
+        else:
+            self.hits += 1
+            metrics.inc("cache_requests_total", cache=self.name, result="hit")
+        return value
+
+    def set(self, key, value, ttl=None):
+        self.memory.set(key, value, ttl)
+        if self.disk is not None:
+            self.disk.set(key, value, ttl)
+
+    def clear(self):
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
@@ -0,0 +1,386 @@
+# -*- coding: utf-8 -*-
+"""
+HTTP client used for all the requests to GitHub.
+
+A single requests.Session is shared by the threads of the process. It keeps
+a pool of keep-alive connections for each host, so that API calls and raw
+file downloads do not pay for a new TLS handshake every time, and retries
+idempotent requests with a backoff on connection errors and 5xx responses.
+
+GET requests to the API are conditional: the ETag and Last-Modified headers of
+the previous response for the same URL are sent, and a 304 Not Modified (which
+does not count against the rate limit) is answered with the stored response.
+
+Requests to the API are scheduled with the rate limit of their token, known
+from the X-RateLimit-* headers of the responses. The threads sending requests
+with a token queue for their send slot, high priority requests first. When
+the remaining requests run low, low priority requests are dropped and the
+slots of normal ones are spread until the reset. Requests hitting a secondary
+rate limit are retried after the Retry-After delay, or an exponential backoff.
+"""
+from collections import namedtuple
+import hashlib
+import heapq
+import itertools
+import logging
+import os
+import re
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from urllib3.util.retry import Retry
+
+from pep8speaks import cache, metrics
+from pep8speaks.constants import (
+    BASE_URL, CONDITIONAL_CACHE_BYTES, CONDITIONAL_CACHE_MAX_BODY, CONDITIONAL_CACHE_SIZE, HTTP_BACKOFF, HTTP_POOL_SIZE,
+    HTTP_RETRIES, HTTP_TIMEOUT, RATE_LIMIT_BACKOFF, RATE_LIMIT_MAX_WAIT, RATE_LIMIT_RESERVE, RATE_LIMIT_RETRIES,
+)
+
+# Hosts which get their own pool of connections
+HOSTS = ["https://api.github.com", "https://raw.githubusercontent.com"]
+
+# Priorities of the requests. Comments are high, optional requests like
+# starring a repository are low.
+HIGH, NORMAL, LOW = "high", "normal", "low"
+PRIORITY_RANKS = {HIGH: 0, NORMAL: 1, LOW: 2}
+
+# A response stored to answer conditional requests
+StoredResponse = namedtuple(
+    "StoredResponse", ["etag", "last_modified", "status_code", "headers", "content", "encoding"])
+
+_conditional_cache = cache.LRUCache(
+    CONDITIONAL_CACHE_SIZE, CONDITIONAL_CACHE_BYTES, size_of=lambda stored: len(stored.content))
+
+_session = None
+_session_lock = threading.Lock()
+
+# Rate limit of each token
+_rate_limits = {}
+_rate_limits_lock = threading.Lock()
+
+
+def _make_session():
+    retry = Retry(
+        total=HTTP_RETRIES,
+        backoff_factor=HTTP_BACKOFF,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,
+        raise_on_status=False,
+    )
+    session = requests.Session()
+    for host in HOSTS:
+        session.mount(host, HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_SIZE, max_retries=retry))
+    # Other hosts, like github.com for the diff of a Pull Request
+    session.mount("https://", HTTPAdapter(pool_maxsize=HTTP_POOL_SIZE, max_retries=retry))
+    return session
+
+
+def get_session():
+    """Return the session of this process"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = _make_session()
+    return _session
+
+
+def _reset_session():
+    # Connections can not be shared with a forked process
+    global _session, _session_lock
+    _session = None
+    _session_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_session)
+
+
+def _token_key(headers):
+    """Identify the token of the request without keeping it"""
+    return hashlib.sha256((headers or {}).get("Authorization", "").encode()).hexdigest()
+
+
+class RateLimit(object):
+    """
+    Requests left to a token until the reset of its rate limit, as reported
+    by the last response, minus the requests sent since then.
+
+    The threads sending requests with the token wait in a queue for their
+    send slot, handed out by acquire: high priority requests are served
+    first, and near the limit the slots of the other requests are spread
+    until the reset.
+    """
+    def __init__(self, name=""):
+        self.name = name
+        self.remaining = None  # Unknown
+        self.reset = 0.0
+        self.blocked_until = 0.0
+        # Earliest time of the next request spread until the reset
+        self.next_slot = 0.0
+        self._condition = threading.Condition()
+        # Heap of the (rank of the priority, arrival) of the waiting requests
+        self._waiting = []
+        self._arrivals = itertools.count()
+
+    def update(self, response):
+        remaining = response.headers.get("X-RateLimit-Remaining")
+        # Other resources (search, graphql) have their own limits
+        if remaining is None or response.headers.get("X-RateLimit-Resource", "core") != "core":
+            return
+        with self._condition:
+            self.remaining = int(remaining)
+            self.reset = float(response.headers.get("X-RateLimit-Reset", 0))
+            self._condition.notify_all()
+        if response.headers.get("X-RateLimit-Limit"):
+            metrics.set_gauge("github_rate_limit_limit", int(response.headers["X-RateLimit-Limit"]), token=self.name)
+        metrics.set_gauge("github_rate_limit_remaining", self.remaining, token=self.name)
+        metrics.set_gauge("github_rate_limit_reset", self.reset, token=self.name)
+
+    def block(self, seconds):
+        """Send no request in the next seconds"""
+        with self._condition:
+            self.blocked_until = max(self.blocked_until, time.time() + seconds)
+            self._condition.notify_all()
+
+    def _delay(self, priority, now):
+        """Seconds before the next request of priority can be sent, with the lock held"""
+        if self.reset <= now:
+            self.remaining = None
+        if self.blocked_until > now:
+            return self.blocked_until - now
+        if self.remaining is not None and self.remaining <= 0:
+            return self.reset - now
+        if self.remaining is not None and self.remaining <= RATE_LIMIT_RESERVE and priority != HIGH:
+            return max(self.next_slot - now, 0)
+        return 0
+
+    def acquire(self, priority=NORMAL, timeout=RATE_LIMIT_MAX_WAIT):
+        """
+        Wait for the send slot of a request of priority, count the request
+        and return the seconds waited. Return None if the request should be
+        dropped: low priority requests are not sent when they would wait.
+        A request waits at most timeout seconds.
+        """
+        started_at = time.time()
+        with self._condition:
+            if priority == LOW and (self._waiting or self._delay(priority, started_at) > 0):
+                return None
+
+            ticket = (PRIORITY_RANKS[priority], next(self._arrivals))
+            heapq.heappush(self._waiting, ticket)
+            now = started_at
+            try:
+                while True:
+                    left = timeout - (now - started_at)
+                    if self._waiting[0] == ticket:
+                        delay = self._delay(priority, now)
+                        if delay <= 0 or left <= 0:
+                            break
+                        self._condition.wait(min(delay, left))
+                    elif left <= 0:
+                        break
+                    else:  # Requests ahead in the queue go first
+                        self._condition.wait(left)
+                    now = time.time()
+
+                if self.remaining:
+                    if self.remaining <= RATE_LIMIT_RESERVE and priority != HIGH:
+                        self.next_slot = max(self.next_slot, now) + (self.reset - now) / self.remaining
+                    self.remaining -= 1
+                return now - started_at
+            finally:
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+                self._condition.notify_all()
+
+
+def get_rate_limit(headers):
+    """Return the RateLimit of the token of the request headers"""
+    key = _token_key(headers)
+    with _rate_limits_lock:
+        if key not in _rate_limits:
+            _rate_limits[key] = RateLimit(key[:8])
+        return _rate_limits[key]
+
+
+def _retry_delay(response, attempt):
+    """Return the seconds to wait before retrying a response hitting a rate limit, or None"""
+    if response.status_code not in (403, 429):
+        return None
+    retry_after = response.headers.get("Retry-After")
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:  # An HTTP date
+            pass
+    if response.headers.get("X-RateLimit-Remaining") == "0":
+        return max(float(response.headers.get("X-RateLimit-Reset", 0)) - time.time(), 0) + 1
+    if response.status_code == 429 or b"secondary rate limit" in response.content.lower():
+        return RATE_LIMIT_BACKOFF * 2 ** attempt
+    return None  # Forbidden for another reason
+
+
+# Segments of the API paths replaced by a placeholder in the endpoint label
+ENDPOINT_PATTERNS = [
+    (re.compile(r"^/repos/[^/]+/[^/]+"), "/repos/{owner}/{repo}"),
+    (re.compile(r"^/user/starred/[^/]+/[^/]+"), "/user/starred/{owner}/{repo}"),
+    (re.compile(r"^/user/following/[^/]+"), "/user/following/{user}"),
+    (re.compile(r"^/users/[^/]+"), "/users/{user}"),
+    # File paths and branch names have slashes
+    (re.compile(r"/(contents|refs?/heads)/.+$"), r"/\1/{path}"),
+    (re.compile(r"/compare/[^/]+$"), "/compare/{range}"),
+    (re.compile(r"/[0-9a-f]{40}(?=/|$)"), "/{sha}"),
+    (re.compile(r"/\d+(?=/|$)"), "/{number}"),
+]
+
+
+def endpoint(url):
+    """Return the path of an API URL with placeholders for the names and numbers"""
+    path = urlsplit(url).path
+    for pattern, placeholder in ENDPOINT_PATTERNS:
+        path = pattern.sub(placeholder, path)
+    return path
+
+
+def _dropped_response(method, url):
+    """Answer of a request which is not sent to save the rate limit"""
+    response = requests.Response()
+    response.status_code = 429
+    response._content = b""
+    response.url = url
+    response.reason = "Dropped near the rate limit"
+    response.request = requests.Request(method, url).prepare()
+    return response
+
+
+def _conditional_key(url, kwargs):
+    headers = kwargs.get("headers") or {}
+    # Responses depend on who is asking, and in which format
+    authorization = _token_key(headers)
+    params = kwargs.get("params")
+    if isinstance(params, dict):
+        params = sorted(params.items())
+    return url, repr(params), headers.get("Accept"), authorization
+
+
+def _stored_response(stored, not_modified):
+    """Build the response of a 304 answer from the stored one"""
+    response = requests.Response()
+    response.status_code = stored.status_code
+    response.headers = CaseInsensitiveDict(stored.headers)
+    # Keep the fresh rate limit headers
+    for header, value in not_modified.headers.items():
+        if header.lower().startswith("x-ratelimit-") or header.lower() == "date":
+            response.headers[header] = value
+    response._content = stored.content
+    response.encoding = stored.encoding
+    response.url = not_modified.url
+    response.request = not_modified.request
+    response.reason = "OK"
+    return response
+
+
+def request(method, url, priority=NORMAL, **kwargs):
+    """
+    Send a request with the shared session.
+
+    Same arguments as requests.request, and the priority of the request
+    for the rate limit (HIGH, NORMAL or LOW). A default timeout is used.
+    A LOW priority request is not sent near the rate limit, and gets a
+    429 response.
+    """
+    if not url.startswith(BASE_URL):
+        return _send(method, url, kwargs)
+
+    rate_limit = get_rate_limit(kwargs.get("headers"))
+    for attempt in range(RATE_LIMIT_RETRIES + 1):
+        waited = rate_limit.acquire(priority)
+        if waited is None:
+            metrics.inc("github_rate_limited_total", action="dropped")
+            return _dropped_response(method, url)
+        if waited > 0:
+            metrics.inc("github_rate_limited_total", action="waited")
+
+        started_at = time.monotonic()
+        response = _send(method, url, kwargs)
+        labels = {"method": method, "endpoint": endpoint(url)}
+        metrics.observe("github_api_request_seconds", time.monotonic() - started_at, **labels)
+        metrics.inc("github_api_requests_total", status=str(response.status_code), **labels)
+        rate_limit.update(response)
+        delay = _retry_delay(response, attempt)
+        if delay is None or delay > RATE_LIMIT_MAX_WAIT or attempt == RATE_LIMIT_RETRIES:
+            return response
+        logging.warning("Rate limited by GitHub on %s %s, retrying in %s seconds", method, url, delay)
+        metrics.inc("github_rate_limited_total", action="retried")
+        rate_limit.block(delay)
+    return response
+
+
+def _send(method, url, kwargs):
+    kwargs = dict(kwargs)
+    kwargs.setdefault("timeout", HTTP_TIMEOUT)
+
+    key = stored = None
+    if method == "GET" and url.startswith(BASE_URL) and not kwargs.get("stream"):
+        key = _conditional_key(url, kwargs)
+        stored = _conditional_cache.get(key)
+        if stored is not cache.MISSING:
+            headers = dict(kwargs.get("headers") or {})
+            if stored.etag:
+                headers.setdefault("If-None-Match", stored.etag)
+            if stored.last_modified:
+                headers.setdefault("If-Modified-Since", stored.last_modified)
+            kwargs["headers"] = headers
+
+    response = get_session().request(method, url, **kwargs)
+    metrics.inc("http_requests_total", host=urlsplit(url).hostname)
+
+    if key is None:
+        return response
+    if response.status_code == 304 and stored is not cache.MISSING:
+        metrics.inc("http_conditional_requests_total", result="not_modified")
+        return _stored_response(stored, response)
+
+    etag, last_modified = response.headers.get("ETag"), response.headers.get("Last-Modified")
+    if response.status_code == 200 and (etag or last_modified) and len(response.content) <= CONDITIONAL_CACHE_MAX_BODY:
+        metrics.inc("http_conditional_requests_total", result="modified")
+        _conditional_cache.set(key, StoredResponse(
+            etag, last_modified, response.status_code, dict(response.headers), response.content, response.encoding))
+    return response
+
+
+def connection_stats():
+    """
+    Return the number of requests sent and of connections opened for each
+    host since the start of the process.
+    """
+    stats = {}
+    session = _session
+    if session is None:
+        return stats
+
+    for adapter in session.adapters.values():
+        pools = adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            host_stats = stats.setdefault(pool.host, {"requests": 0, "connections": 0})
+            host_stats["requests"] += pool.num_requests
+            host_stats["connections"] += pool.num_connections
+
+    for host_stats in stats.values():
+        host_stats["reused"] = host_stats["requests"] - host_stats["connections"]
+    return stats
+
+
+def _collect_connection_stats():
+    for host, host_stats in connection_stats().items():
+        for name, value in host_stats.items():
+            metrics.set_gauge(f"http_connection_{name}", value, host=host)
+
+
+metrics.register_collector(_collect_connection_stats)
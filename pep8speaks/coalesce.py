@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""
+Coalescing of the pull_request events of a Pull Request.
+
+When commits are pushed several times in a row, only the newest head commit
+matters. Every queued event registers its head SHA for its Pull Request, so
+that the work for an older head is dropped before it starts, or cancelled
+before commenting when it is already running.
+"""
+import threading
+
+# Actions of the pull_request events which lint a new head commit. The other
+# ones (labeled, edited...) must not supersede them.
+HEAD_ACTIONS = ("opened", "reopened", "synchronize")
+
+_lock = threading.Lock()
+# (repository, pr_number) -> (id of the newest job, its head sha)
+_heads = {}
+
+
+def key_of(event, payload):
+    """
+    Return the (repository, pr_number) key of a pull_request event linting
+    a new head commit, or None
+    """
+    if event != "pull_request" or "pull_request" not in payload or payload.get("action") not in HEAD_ACTIONS:
+        return None
+    return payload["repository"]["full_name"], payload["pull_request"]["number"]
+
+
+def register(key, job_id, sha):
+    """Record the job as the newest one of the Pull Request"""
+    with _lock:
+        _heads[key] = (job_id, sha)
+
+
+def is_superseded(key, job_id):
+    """Return True if a newer job has been registered for the Pull Request"""
+    with _lock:
+        head = _heads.get(key)
+    return head is not None and head[0] != job_id
+
+
+def is_stale(repository, pr_number, sha):
+    """Return True if the Pull Request has a newer head commit than sha"""
+    with _lock:
+        head = _heads.get((repository, pr_number))
+    return head is not None and head[1] != sha
+
+
+def forget(key, job_id):
+    """Forget the Pull Request once its newest job is finished"""
+    with _lock:
+        if _heads.get(key, (None, ))[0] == job_id:
+            del _heads[key]
@@ -5,4 +5,61 @@ load_dotenv()
 GITHUB_TOKEN = os.environ.get('GITHUB_TOKEN', '')
 LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
 BASE_URL = 'https://api.github.com'
+
+# Connections kept alive for each host, and behaviour of the HTTP requests
+HTTP_POOL_SIZE = int(os.environ.get('HTTP_POOL_SIZE', 10))
+HTTP_TIMEOUT = float(os.environ.get('HTTP_TIMEOUT', 30))
+HTTP_RETRIES = int(os.environ.get('HTTP_RETRIES', 3))
+HTTP_BACKOFF = float(os.environ.get('HTTP_BACKOFF', 0.5))
+# Requests to the API left before the rate limit under which low priority requests are dropped,
+# and normal ones are spread until the reset
+RATE_LIMIT_RESERVE = int(os.environ.get('RATE_LIMIT_RESERVE', 200))
+RATE_LIMIT_MAX_WAIT = float(os.environ.get('RATE_LIMIT_MAX_WAIT', 300))  # Seconds a request waits at most
+# Retries of the requests hitting a secondary rate limit, with an exponential backoff in seconds
+RATE_LIMIT_RETRIES = int(os.environ.get('RATE_LIMIT_RETRIES', 3))
+RATE_LIMIT_BACKOFF = float(os.environ.get('RATE_LIMIT_BACKOFF', 60))
+# Responses kept to send conditional requests to the API
+CONDITIONAL_CACHE_SIZE = int(os.environ.get('CONDITIONAL_CACHE_SIZE', 2048))
+CONDITIONAL_CACHE_MAX_BODY = int(os.environ.get('CONDITIONAL_CACHE_MAX_BODY', 1024 * 1024))  # In bytes
+CONDITIONAL_CACHE_BYTES = int(os.environ.get('CONDITIONAL_CACHE_BYTES', 64 * 1024 * 1024))  # Bodies kept, in bytes
+
+# Size in bytes above which the diff of a Pull Request is not downloaded, 0 for no limit
+MAX_DIFF_SIZE = int(os.environ.get('MAX_DIFF_SIZE', 10 * 1024 * 1024))
+
+# Number of files downloaded at the same time for a Pull Request
+FETCH_WORKERS = int(os.environ.get('FETCH_WORKERS', 8))
+# Pool of processes linting and fixing the files, 0 to do it in the process handling the event
+LINT_WORKERS = int(os.environ.get('LINT_WORKERS', 2))
+LINT_MAX_JOBS = int(os.environ.get('LINT_MAX_JOBS', 500))  # Jobs before a process is replaced
+LINT_TIMEOUT = float(os.environ.get('LINT_TIMEOUT', 60))  # Seconds before a job is killed
+
+# Directory of the scratch files of the linters and autopep8, /dev/shm when available by default
+SCRATCH_DIR = os.environ.get('SCRATCH_DIR', '')
+
+# Downloaded files are cached in memory, and on disk if CACHE_DIR is set
+CACHE_SIZE = int(os.environ.get('CACHE_SIZE', 1024))  # Number of entries in memory
+CACHE_BYTES = int(os.environ.get('CACHE_BYTES', 64 * 1024 * 1024))  # Size of the files in memory, in bytes
+CACHE_DIR = os.environ.get('CACHE_DIR', '')
+CACHE_DIR_SIZE = int(os.environ.get('CACHE_DIR_SIZE', 256 * 1024 * 1024))  # In bytes
+CACHE_REF_TTL = float(os.environ.get('CACHE_REF_TTL', 60))  # Seconds for files fetched by branch name
+LINT_CACHE_SIZE = int(os.environ.get('LINT_CACHE_SIZE', 4096))  # Results of the linters kept in memory
+PR_STATE_SIZE = int(os.environ.get('PR_STATE_SIZE', 512))  # Pull Requests whose last analyzed head is kept
+CONFIG_CACHE_SIZE = int(os.environ.get('CONFIG_CACHE_SIZE', 256))  # Configurations resolved from config files
+FIX_CACHE_SIZE = int(os.environ.get('FIX_CACHE_SIZE', 1024))  # Files fixed by autopep8 kept in memory
+FIX_CACHE_TTL = float(os.environ.get('FIX_CACHE_TTL', 3600))  # Seconds for which they are kept
+
+# Forks of the repositories made for `@pep8speaks pep8ify`
+FORK_READY_TIMEOUT = float(os.environ.get('FORK_READY_TIMEOUT', 60))  # Seconds to wait for a new fork
+FORK_REGISTRY_TTL = float(os.environ.get('FORK_REGISTRY_TTL', 600))  # Seconds before the forks are listed again
+
+# Webhook events are handled in the background by a queue of jobs
+JOB_QUEUE_BACKEND = os.environ.get('JOB_QUEUE_BACKEND', 'memory')  # Alternative option - sqlite
+JOB_QUEUE_PATH = os.environ.get('JOB_QUEUE_PATH', 'jobs.sqlite3')
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+# Seconds to wait after a push to a Pull Request before linting it
+COALESCE_WINDOW = float(os.environ.get('COALESCE_WINDOW', 10))
+
+# Metrics of the gunicorn workers, merged when /metrics is requested
+METRICS_DIR = os.environ.get('METRICS_DIR', '')
+METRICS_INTERVAL = float(os.environ.get('METRICS_INTERVAL', 10))  # Seconds between two snapshots of a worker
 FLASK_DEBUG=0
\ No newline at end of file
@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+"""
+Diff of a Pull Request, shared by all the helpers handling an event.
+"""
+from array import array
+import bisect
+import logging
+import re
+import threading
+
+from pep8speaks import metrics, utils
+from pep8speaks.constants import MAX_DIFF_SIZE
+
+# Files listed at most by the API for a Pull Request
+MAX_LISTED_FILES = 3000
+
+HUNK_PATTERN = re.compile(
+    r"^@@ -(?P<old_start>\d+)(?:,(?P<old_count>\d+))? \+(?P<new_start>\d+)(?:,(?P<new_count>\d+))? @@")
+
+
+class AddedLines(object):
+    """
+    Set of the added line numbers of a file.
+
+    Consecutive lines are stored as ranges in two arrays of the first and
+    last line of each range, so a membership test is a binary search and
+    a block of thousands of added lines takes two integers.
+    """
+    __slots__ = ("_starts", "_ends")
+
+    def __init__(self, lines=()):
+        self._starts = array("l")
+        self._ends = array("l")
+        for line in lines:
+            self.add(line)
+
+    def add(self, line):
+        """Add a line number. Lines must be added in increasing order."""
+        if self._ends:
+            if line <= self._ends[-1]:
+                raise ValueError(f"Line {line} added after line {self._ends[-1]}")
+            if line == self._ends[-1] + 1:
+                self._ends[-1] = line
+                return
+        self._starts.append(line)
+        self._ends.append(line)
+
+    def __contains__(self, line):
+        index = bisect.bisect_right(self._starts, line) - 1
+        return index >= 0 and line <= self._ends[index]
+
+    def __iter__(self):
+        for start, end in zip(self._starts, self._ends):
+            yield from range(start, end + 1)
+
+    def __len__(self):
+        return sum(end - start + 1 for start, end in zip(self._starts, self._ends))
+
+    def __bool__(self):
+        return len(self._starts) > 0
+
+    def __eq__(self, other):
+        if not isinstance(other, AddedLines):
+            return NotImplemented
+        return self._starts == other._starts and self._ends == other._ends
+
+    def __repr__(self):
+        ranges = ", ".join(f"{start}-{end}" for start, end in zip(self._starts, self._ends))
+        return f"AddedLines({ranges})"
+
+
+def _unquote(path):
+    """Decode a path quoted by git, e.g. when it has non-ASCII characters"""
+    if not path.startswith('"'):
+        return path
+    return path[1:-1].encode("latin-1", "backslashreplace").decode("unicode_escape").encode("latin-1").decode("utf-8")
+
+
+def iter_diff(lines, encoding=None):
+    """
+    Yield the (file name, AddedLines) pairs of the files of a unified diff,
+    as soon as each file is read. File names start with a `/`, deleted files
+    are left out. lines can be an iterator, it is consumed only once.
+    """
+    target = None
+    added_lines = None
+    # Between a `diff --git` line and the `+++` line of the same file
+    git_header = False
+    # Lines left in the current hunk, so that content lines starting with
+    # `+++` or `diff` are not mistaken for headers
+    old_left = new_left = 0
+    line_number = 0
+
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode(encoding or "utf-8", errors="replace")
+
+        if old_left > 0 or new_left > 0:
+            marker = line[:1]
+            if marker == "+":
+                added_lines.add(line_number)
+                line_number += 1
+                new_left -= 1
+            elif marker == "-":
+                old_left -= 1
+            elif marker in (" ", ""):  # Context line
+                line_number += 1
+                old_left -= 1
+                new_left -= 1
+            # Else a "\ No newline at end of file" line
+            continue
+
+        line = line.rstrip("\r")
+        if line.startswith("diff --git "):
+            if target is not None:
+                yield target, added_lines
+            # The target of files without hunks (renamed, binary...)
+            target = "/" + _unquote(line.rsplit(" b/", 1)[-1]) if " b/" in line else None
+            added_lines = AddedLines()
+            git_header = True
+        elif line.startswith("+++ "):
+            if not git_header:
+                # Plain unified diff, without `diff --git` lines
+                if target is not None:
+                    yield target, added_lines
+                added_lines = AddedLines()
+            git_header = False
+            path = _unquote(line[4:].split("\t")[0])
+            target = None if path == "/dev/null" else "/" + path.split("/", 1)[-1]
+        elif line.startswith("@@ ") and added_lines is not None:
+            match = HUNK_PATTERN.match(line)
+            if match:
+                old_left = int(match["old_count"] or 1)
+                new_left = int(match["new_count"] or 1)
+                line_number = int(match["new_start"])
+
+    if target is not None:
+        yield target, added_lines
+
+
+def parse_diff(lines, encoding=None):
+    """
+    Return a dictionary of the files of a unified diff, paired with the
+    AddedLines of their added line numbers. File names start with a `/`.
+    """
+    return dict(iter_diff(lines, encoding))
+
+
+def list_files(repository, pr_number):
+    """
+    Yield the files of the Pull Request from the paginated listing of the
+    API, a page being fetched only when the previous one is consumed.
+    """
+    query = f"/repos/{repository}/pulls/{pr_number}/files"
+    params = {"per_page": 100}
+    while query:
+        r = utils.query_request(query, params=params)
+        if r.status_code != 200:
+            return
+        yield from r.json()
+        # The URL of the next page has the parameters
+        query, params = r.links.get("next", {}).get("url"), None
+
+
+def parse_patch(filename, patch):
+    """Return the AddedLines of the patch of a file in the files listing of a Pull Request"""
+    lines = [f"--- a/{filename}", f"+++ b/{filename}"] + patch.splitlines()
+    return parse_diff(lines).get("/" + filename, AddedLines())
+
+
+class DiffTooLarge(Exception):
+    """Raised when a diff grows above MAX_DIFF_SIZE bytes"""
+
+
+def _read_lines(r):
+    """
+    Yield the lines of the streamed response r, so that the whole diff is
+    never in memory. Lines are split on line feeds only, unlike iter_lines
+    which also splits the content lines with a carriage return.
+    """
+    size = 0
+    pending = b""
+    for chunk in r.iter_content(chunk_size=64 * 1024):
+        size += len(chunk)
+        if MAX_DIFF_SIZE and size > MAX_DIFF_SIZE:
+            raise DiffTooLarge(f"{r.url} is larger than {MAX_DIFF_SIZE} bytes")
+        lines = (pending + chunk).split(b"\n")
+        pending = lines.pop()
+        yield from lines
+    if pending:
+        yield pending
+
+
+class PullRequestDiff(object):
+    """
+    The diff of a Pull Request, downloaded and parsed once on first use.
+    The diff is parsed while it is downloaded.
+
+    Diffs larger than MAX_DIFF_SIZE bytes, or too large for the API, are not
+    downloaded. The added lines are then read from the patches of the files
+    listing instead, where the patches of the largest files are left out
+    (degraded is True).
+    """
+    def __init__(self, repository, pr_number):
+        self.repository = repository
+        self.pr_number = pr_number
+        self.degraded = False
+        self._files = None
+        self._blob_shas = None
+        self._lock = threading.Lock()
+
+    @metrics.timer("stage_seconds", stage="diff")
+    def _fetch(self):
+        headers = {"Accept": "application/vnd.github.VERSION.diff"}
+        query = f"/repos/{self.repository}/pulls/{self.pr_number}"
+        r = utils.query_request(query, headers=headers, stream=True)
+        try:
+            # The API refuses too large diffs
+            if r.status_code != 406:
+                return parse_diff(_read_lines(r), encoding=r.encoding)
+        except DiffTooLarge:
+            pass
+        finally:
+            r.close()
+
+        logging.warning("The diff of %s#%s is too large, using the files listing", self.repository, self.pr_number)
+        self.degraded = True
+        return self._files_from_listing()
+
+    def _files_from_listing(self):
+        files = {}
+        for pr_file in list_files(self.repository, self.pr_number):
+            if pr_file["status"] == "removed":
+                continue
+            filename = pr_file["filename"]
+            files["/" + filename] = parse_patch(filename, pr_file.get("patch", ""))
+        return files
+
+    @property
+    def files(self):
+        """Dictionary of the files modified/added in the PR, paired with the AddedLines of the file"""
+        with self._lock:
+            if self._files is None:
+                self._files = self._fetch()
+        return self._files
+
+    @property
+    def blob_shas(self):
+        """Dictionary of the files in the PR (not removed), paired with the SHA of their git blob"""
+        with self._lock:
+            if self._blob_shas is None:
+                self._blob_shas = {
+                    "/" + pr_file["filename"]: pr_file["sha"]
+                    for pr_file in list_files(self.repository, self.pr_number)
+                    if pr_file["status"] != "removed" and pr_file.get("sha")
+                }
+        return self._blob_shas
+
+    def py_files(self, exclude=None):
+        """Same as files, for the Python files which are not excluded"""
+        if exclude is None:
+            exclude = []
+        return {
+            diff_file: lines for diff_file, lines in self.files.items()
+            if diff_file[-3:] == ".py" and not utils.filename_match(diff_file, exclude)
+        }
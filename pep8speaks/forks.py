@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""
+Forks of the repositories made by the bot account for `@pep8speaks pep8ify`.
+
+The forks of the account are listed once and indexed by their upstream
+repository, known from the description given to them when they are created.
+A repository forked before is not forked again, its branches are reset to
+the commits to fix instead. A new fork is ready after a while, which is
+polled with an exponential backoff.
+"""
+import logging
+import re
+import threading
+import time
+
+from pep8speaks import utils
+from pep8speaks.constants import FORK_READY_TIMEOUT, FORK_REGISTRY_TTL
+
+# Description of the forks, see describe
+DESCRIPTION_PATTERN = re.compile(r"^Forked from @[^']+'s (?P<upstream>[\w.-]+/[\w.-]+)$")
+
+
+def describe(upstream):
+    """Return the description of the fork of the upstream repository"""
+    author = upstream.split("/")[0]
+    return f"Forked from @{author}'s {upstream}"
+
+
+def list_forks():
+    """Yield the (upstream, fork) full names of the forks of the bot account"""
+    query = "/user/repos"
+    params = {"type": "owner", "per_page": 100}
+    while query:
+        r = utils.query_request(query, params=params)
+        if r.status_code != 200:
+            return
+        for repo in r.json():
+            match = DESCRIPTION_PATTERN.match(repo.get("description") or "")
+            if repo.get("fork") and match:
+                yield match["upstream"], repo["full_name"]
+        # The URL of the next page has the parameters
+        query, params = r.links.get("next", {}).get("url"), None
+
+
+class ForkRegistry(object):
+    """
+    Full names of the forks of the bot account, keyed by the full name of
+    their upstream repository. The forks are listed again after ttl seconds.
+    """
+    def __init__(self, ttl=FORK_REGISTRY_TTL):
+        self.ttl = ttl
+        self._forks = {}
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        now = time.monotonic()
+        if self._loaded_at is None or now - self._loaded_at > self.ttl:
+            self._forks = dict(list_forks())
+            self._loaded_at = now
+
+    def get(self, upstream):
+        with self._lock:
+            self._load()
+            return self._forks.get(upstream)
+
+    def add(self, upstream, fork):
+        with self._lock:
+            self._forks[upstream] = fork
+
+    def remove(self, upstream):
+        with self._lock:
+            self._forks.pop(upstream, None)
+
+
+registry = ForkRegistry()
+
+
+def wait_until_ready(fork, timeout=FORK_READY_TIMEOUT):
+    """
+    Wait for a new fork to be available, checking after 1, 2, 4... seconds.
+    Return False if it is still not there after timeout seconds.
+    """
+    query = f"/repos/{fork}"
+    deadline = time.monotonic() + timeout
+    delay = 1
+    while utils.query_request(query).status_code != 200:
+        left = deadline - time.monotonic()
+        if left <= 0:
+            logging.warning("The fork %s is not ready after %s seconds", fork, timeout)
+            return False
+        time.sleep(min(delay, left))
+        delay *= 2
+    return True
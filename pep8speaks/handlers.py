@@ -1,5 +1,5 @@
 # -*- coding: utf-8 -*-
-from pep8speaks import helpers, utils, models
+from pep8speaks import client, coalesce, helpers, utils, models
 
 
 def handle_pull_request(request):
@@ -9,7 +9,7 @@ def handle_pull_request(request):
         return utils.Response(ghrequest)
 
     # If the PR contains at least one Python file
-    pythonic_pr = helpers.check_pythonic_pr(ghrequest.repository, ghrequest.pr_number)
+    pythonic_pr = helpers.check_pythonic_pr(ghrequest)
 
     if not pythonic_pr:
         return utils.Response(ghrequest)
@@ -30,10 +30,17 @@ def handle_pull_request(request):
                 new_msg = msg.replace("{name}", ghrequest.author)
                 config["message"][act][pos] = new_msg
 
+    # A newer commit has been pushed, its own event takes care of the PR
+    if coalesce.is_stale(ghrequest.repository, ghrequest.pr_number, ghrequest.after_commit_hash):
+        return utils.Response(ghrequest)
+
     # Updates ghrequest with the results
     # This function runs pycodestyle
     helpers.run_pycodestyle(ghrequest, config)
 
+    if coalesce.is_stale(ghrequest.repository, ghrequest.pr_number, ghrequest.after_commit_hash):
+        return utils.Response(ghrequest)
+
     # Construct the comment
     header, body, footer, ERROR = helpers.prepare_comment(ghrequest, config)
 
@@ -102,18 +109,13 @@ def _pep8ify(ghrequest, config):
     ghrequest.target_repo_branch = ghrequest.pull_request["head"]["ref"]
     ghrequest.results = {}
 
-    # Check if the fork of the target repo exists
-    # If yes, then delete it
-    helpers.delete_if_forked(ghrequest)
-    # Fork the target repository
+    # Fork the target repository, or reuse its existing fork
     helpers.fork_for_pr(ghrequest)
-    # Update the fork description. This helps in fast deleting it
-    helpers.update_fork_desc(ghrequest)
-    # Create a new branch for the PR
+    # Create a new branch for the PR, at the head of the PR
     helpers.create_new_branch(ghrequest)
     # Fix the errors in the files
     helpers.autopep8ify(ghrequest, config)
-    # Commit each change onto the branch
+    # Commit the changes onto the branch
     helpers.commit(ghrequest)
     # Create a PR from the branch to the target repository
     helpers.create_pr(ghrequest)
@@ -126,7 +128,7 @@ def _pep8ify(ghrequest, config):
         comment += f" @{ghrequest.author}"
 
     query = f"/repos/{ghrequest.repository}/issues/{str(ghrequest.pr_number)}/comments"
-    response = utils.query_request(query, method='POST', json={"body": comment})
+    response = utils.query_request(query, method='POST', json={"body": comment}, priority=client.HIGH)
     ghrequest.comment_response = response.json()
 
     return utils.Response(ghrequest)
@@ -152,7 +154,7 @@ def _create_diff(ghrequest, config):
         comment += f" @{ghrequest.author}"
 
     query = f"/repos/{ghrequest.repository}/issues/{str(ghrequest.pr_number)}/comments"
-    response = utils.query_request(query, method='POST', json={"body": comment})
+    response = utils.query_request(query, method='POST', json={"body": comment}, priority=client.HIGH)
     ghrequest.comment_response = response.json()
 
     if ghrequest.error:
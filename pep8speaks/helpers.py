@@ -1,33 +1,70 @@
 # -*- coding: utf-8 -*-
 
-import base64
+from concurrent.futures import ThreadPoolExecutor
 import configparser
+import copy
 import datetime
+import hashlib
 import json
 import logging
 import os
 from pathlib import Path
+import posixpath
 import re
-import subprocess
-import time
-
-import unidiff
+from urllib.parse import quote
+
+try:
+    import tomllib
+except ImportError:  # Python < 3.11
+    try:
+        import tomli as tomllib
+    except ImportError:
+        tomllib = None
 import yaml
-from pep8speaks import utils
+from pep8speaks import cache, client, diff, forks, linters, metrics, models, utils, workers
+from pep8speaks.constants import (
+    CACHE_BYTES, CACHE_DIR, CACHE_DIR_SIZE, CACHE_REF_TTL, CACHE_SIZE, CONFIG_CACHE_SIZE, FETCH_WORKERS, FIX_CACHE_SIZE,
+    FIX_CACHE_TTL, LINT_CACHE_SIZE, LINT_WORKERS, PR_STATE_SIZE,
+)
+
+# Files downloaded from the repositories
+_file_cache = cache.Cache("files", CACHE_SIZE, CACHE_DIR, CACHE_DIR_SIZE,
+                          memory_bytes=CACHE_BYTES, size_of=lambda raw_file: len(raw_file.text))
+# Results of the linters for whole files
+_lint_cache = cache.Cache("lint", LINT_CACHE_SIZE, CACHE_DIR, CACHE_DIR_SIZE)
+# Last analyzed head of the Pull Requests, with the results of their files
+_pr_state = cache.Cache("pull_requests", PR_STATE_SIZE, CACHE_DIR, CACHE_DIR_SIZE)
+# Files fixed by autopep8
+_fix_cache = cache.Cache("fixes", FIX_CACHE_SIZE, CACHE_DIR, CACHE_DIR_SIZE)
+
+# Default configuration parameters
+with open(Path(__file__).absolute().parent.parent.joinpath("data", "default_pep8speaks.yml")) as config_file:
+    DEFAULT_CONFIG = yaml.safe_load(config_file)
+
+# Configurations resolved from the config files of the repositories
+_config_cache = cache.LRUCache(CONFIG_CACHE_SIZE)
+
+SHA_PATTERN = re.compile(r"^[0-9a-f]{40}$")
+
+# Files with a pycodestyle/flake8 configuration, the first one found is used
+LINTER_CONFIG_FILES = ["setup.cfg", "tox.ini", ".flake8", "pyproject.toml"]
+# Keys read from them
+LINTER_CONFIG_KEYS = ["max-line-length", "count", "first", "show-pep8", "show-source", "statistics", "hang-closing"]
+LINTER_CONFIG_LIST_KEYS = ["ignore", "exclude", "filename", "select"]
 
 
 def update_users(repository):
     """Star the repository from the bot account"""
     headers = {'Content-Length': '0'}
     query = f"/user/starred/{repository}"
-    return utils.query_request(query=query, method='PUT', headers=headers)
+    return utils.query_request(query=query, method='PUT', headers=headers, priority=client.LOW)
 
 
 def follow_user(user):
     """Follow the user of the service"""
     headers = {'Content-Length': '0'}
     query = f"/user/following/{user}"
-    return utils.query_request(query=query, method='PUT', headers=headers)
+    return utils.query_request(query=query, method='PUT', headers=headers, priority=client.LOW)
 
 
 def read_setup_cfg_file(setup_config_file):
@@ -49,94 +86,128 @@ def read_setup_cfg_file(setup_config_file):
         return linter_cfg_config
 
     # These ones are of type string
-    keys = ["max-line-length", "count", "first", "show-pep8", "show-source", "statistics", "hang-closing"]
-    for key in keys:
+    for key in LINTER_CONFIG_KEYS:
         try:
             value = setup_config_section[key]
             value = value.split(" ")[0].strip(",#")  # In case there are comments on the line
             if key == "max-line-length":
                 value = int(value)
             linter_cfg_config[key] = value
-        except KeyError:
+        except (KeyError, ValueError):  # Missing, or not a number
             pass
 
-    list_keys = ["ignore", "exclude", "filename", "select"]
-    for key in list_keys:
+    for key in LINTER_CONFIG_LIST_KEYS:
         try:
-            value = setup_config_section[key]
-            items = []
-            for line in value.split("\n"):
-                item = line.split(" ")[0].strip(",#")
-                if len(item) > 0:
-                    items.append(item)
-                    linter_cfg_config[key] = items
+            items = _split_list(setup_config_section[key])
+            if items:
+                linter_cfg_config[key] = items
         except KeyError:
             pass
 
     return linter_cfg_config
 
 
-def get_config(repo, base_branch, after_commit_hash):
+def _split_list(value):
+    """Split a list of a config file, with items separated by commas or lines"""
+    items = []
+    for line in value.split("\n"):
+        line = line.split("#")[0]  # In case there are comments on the line
+        items.extend(item for item in re.split(r"[,\s]+", line) if item)
+    return items
+
+
+def read_pyproject_file(pyproject_file):
+    """Return a dictionary for the [tool.pycodestyle]/[tool.flake8] table of pyproject.toml"""
+    if tomllib is None:
+        return {}
+    try:
+        tools = tomllib.loads(pyproject_file).get("tool", {})
+    except tomllib.TOMLDecodeError:
+        return {}
+    section = tools.get("pycodestyle") or tools.get("flake8")
+    if not isinstance(section, dict):
+        return {}
+
+    linter_cfg_config = {}
+    for key in LINTER_CONFIG_KEYS:
+        if key not in section:
+            continue
+        try:
+            linter_cfg_config[key] = int(section[key]) if key == "max-line-length" else section[key]
+        except (TypeError, ValueError):  # Not a number, the default is used
+            pass
+    for key in LINTER_CONFIG_LIST_KEYS:
+        value = section.get(key)
+        items = _split_list(value) if isinstance(value, str) else [str(item) for item in value or []]
+        if items:
+            linter_cfg_config[key] = items
+    return linter_cfg_config
+
+
+def read_linter_config_file(filename, text):
+    """Return a dictionary for the pycodestyle/flake8 configuration in a config file"""
+    if filename == "pyproject.toml":
+        return read_pyproject_file(text)
+    try:
+        return read_setup_cfg_file(text)
+    except configparser.Error:  # Bad INI file
+        return {}
+
+
+def list_root_files(repo, ref):
     """
-    Get .pep8speaks.yml config file from the repository and return
-    the config dictionary
+    Return the set of the names of the files at the root of the repository
+    at ref, or None if it can not be listed.
+    """
+    r = utils.query_request(f"/repos/{repo}/contents", params={"ref": ref})
+    if r.status_code != 200:
+        return None
+    return {entry["name"] for entry in r.json() if entry["type"] == "file"}
 
-    First look in the base branch of the Pull Request (general master branch).
-    If no file is found, then look for a file in the head branch of the Pull Request.
+
+def resolve_config(linter_config_files, new_config_text):
     """
+    Return the config dictionary built from the default configuration, the
+    (filename, text) pairs of the files with a linter configuration, by order
+    of priority, and the text of .pep8speaks.yml (texts can be empty).
 
-    # Default configuration parameters
-    default_config = Path(__file__).absolute().parent.parent.joinpath("data", "default_pep8speaks.yml")
-    with open(default_config, "r") as config_file:
-        config = yaml.safe_load(config_file)
-
-    linters = ["pycodestyle", "flake8"]
-
-    # Read setup.cfg for [pycodestyle] or [flake8] section
-    setup_config_file = ""
-    query = f"https://raw.githubusercontent.com/{repo}/{base_branch}/setup.cfg"
-    r = utils.query_request(query)
-    if r.status_code == 200:
-        setup_config_file = r.text
-    else:  # Try to look for a config in the head branch of the Pull Request
-        new_query = f"https://raw.githubusercontent.com/{repo}/{after_commit_hash}/setup.cfg"
-        r_new = utils.query_request(new_query)
-        if r_new.status_code == 200:
-            setup_config_file = r_new.text
-
-    if len(setup_config_file) > 0:
-        linter_cfg_config = read_setup_cfg_file(setup_config_file)
-        # Copy the setup.cfg config for all linters
+    The result is memoized by the hashes of the texts, and must not be
+    modified. get_config returns a copy of it.
+    """
+    key = hashlib.sha256(repr((linter_config_files, new_config_text)).encode()).digest()
+    config = _config_cache.get(key)
+    if config is not cache.MISSING:
+        return config
+
+    config = copy.deepcopy(DEFAULT_CONFIG)
+    linter_names = ["pycodestyle", "flake8"]
+
+    # Read the [pycodestyle] or [flake8] section of the first config file which has one
+    linter_cfg_config = {}
+    for filename, text in linter_config_files:
+        if len(text) > 0:
+            linter_cfg_config = read_linter_config_file(filename, text)
+        if linter_cfg_config:
+            break
+
+    if linter_cfg_config:
+        # Copy the config for all linters
         new_setup_config = {}
-        for linter in linters:
+        for linter in linter_names:
             new_setup_config[linter] = linter_cfg_config
         config = utils.update_dict(config, new_setup_config)
 
     # Read .pep8speaks.yml
-    new_config_text = ""
-
-    # Configuration file
-    query = f"https://raw.githubusercontent.com/{repo}/{base_branch}/.pep8speaks.yml"
-    r = utils.query_request(query)
-
-    if r.status_code == 200:
-        new_config_text = r.text
-    else:  # Try to look for a config in the head branch of the Pull Request
-        new_query = f"https://raw.githubusercontent.com/{repo}/{after_commit_hash}/.pep8speaks.yml"
-        r_new = utils.query_request(new_query)
-        if r_new.status_code == 200:
-            new_config_text = r_new.text
-
     if len(new_config_text) > 0:
         try:
-            new_config = yaml.load(new_config_text)
+            new_config = yaml.safe_load(new_config_text)
             # overloading the default configuration with the one specified
             config = utils.update_dict(config, new_config)
         except yaml.YAMLError:  # Bad YAML file
             pass
 
     # Create pycodestyle and flake8 command line arguments
-    for linter in linters:
+    for linter in linter_names:
         confs = config.get(linter, dict())
         arguments = []
         for key, value in confs.items():
@@ -151,110 +222,256 @@ def get_config(repo, base_branch, after_commit_hash):
         config[f"{linter}_cmd_config"] = f' {" ".join(arguments)}'
 
     # linters are case-sensitive with error codes
-    for linter in linters:
+    for linter in linter_names:
         if config[linter]["ignore"]:
             config[linter]["ignore"] = [e.upper() for e in list(config[linter]["ignore"])]
 
+    _config_cache.set(key, config)
     return config
 
 
-def get_files_involved_in_pr(repo, pr_number):
+@metrics.timer("stage_seconds", stage="config")
+def get_config(repo, base_branch, after_commit_hash):
     """
-    Return a list of file names modified/added in the PR
+    Get .pep8speaks.yml config file from the repository and return
+    the config dictionary
+
+    First look in the base branch of the Pull Request (general master branch).
+    If no file is found, then look for a file in the head branch of the Pull Request.
+
+    The root directories of both branches are listed first, so that only the
+    config files which exist are downloaded.
     """
-    headers = {"Accept": "application/vnd.github.VERSION.diff"}
+    refs = [base_branch, after_commit_hash]
+    config_files = LINTER_CONFIG_FILES + [".pep8speaks.yml"]
 
-    query = f"/repos/{repo}/pulls/{pr_number}"
-    r = utils.query_request(query, headers=headers)
+    with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as executor:
+        listings = list(executor.map(lambda ref: list_root_files(repo, ref), refs))
 
-    patch = unidiff.PatchSet(r.content.splitlines(), encoding=r.encoding)
+        def read_config_file(filename):
+            for ref, listing in zip(refs, listings):
+                # Try the file anyway when the directory could not be listed
+                if listing is None or filename in listing:
+                    r = fetch_file(repo, ref, filename)
+                    if r.status_code == 200:
+                        return r.text
+            return ""
 
-    files = {}
+        texts = dict(zip(config_files, executor.map(read_config_file, config_files)))
 
-    for patchset in patch:
-        diff_file = patchset.target_file[1:]
-        files[diff_file] = []
-        for hunk in patchset:
-            for line in hunk.target_lines():
-                if line.is_added:
-                    files[diff_file].append(line.target_line_no)
-    return files
+    new_config_text = texts.pop(".pep8speaks.yml")
+    # The handlers modify their config, e.g. the messages
+    return copy.deepcopy(resolve_config(tuple(texts.items()), new_config_text))
 
 
-def get_py_files_in_pr(repo, pr_number, exclude=None):
+def check_pythonic_pr(ghrequest, exclude=None):
+    """
+    Return True if the PR contains at least one Python file
+
+    The files listing of the PR is read until the first Python file, and the
+    diff is only downloaded when the listing is empty or incomplete.
+    """
     if exclude is None:
         exclude = []
-    files = get_files_involved_in_pr(repo, pr_number)
-    for diff_file in list(files.keys()):
-        if diff_file[-3:] != ".py" or utils.filename_match(diff_file, exclude):
-            del files[diff_file]
+    listed = 0
+    for pr_file in diff.list_files(ghrequest.repository, ghrequest.pr_number):
+        listed += 1
+        filename = pr_file["filename"]
+        if pr_file["status"] != "removed" and filename.endswith(".py") and not utils.filename_match(filename, exclude):
+            return True
+    if 0 < listed < diff.MAX_LISTED_FILES:
+        return False
+    return len(ghrequest.pr_diff.py_files(exclude)) > 0
 
-    return files
 
+def fetch_file(repo, ref, path):
+    """
+    Download a file of the repository at ref, and return a RawFile.
 
-def check_pythonic_pr(repo, pr_number):
+    Files are cached by (repo, ref, path). The content at a commit SHA never
+    changes, while a branch name is only trusted for CACHE_REF_TTL seconds.
     """
-    Return True if the PR contains at least one Python file
+    path = path.lstrip("/")
+    key = (repo, ref, path)
+    raw_file = _file_cache.get(key)
+    if raw_file is not cache.MISSING:
+        return raw_file
+
+    with metrics.timer("stage_seconds", stage="file"):
+        r = utils.query_request(f"https://raw.githubusercontent.com/{repo}/{ref}/{path}")
+    raw_file = models.RawFile(r.status_code, r.text, r.encoding)
+    # Missing files are cached too, errors like rate limits are not
+    if r.status_code in (200, 404):
+        ttl = None if SHA_PATTERN.match(ref) else CACHE_REF_TTL
+        _file_cache.set(key, raw_file, ttl=ttl)
+    return raw_file
+
+
+def fetch_files(repo, ref, paths):
+    """
+    Download the files at ref using a pool of threads.
+
+    The RawFile objects are yielded lazily in the order of paths.
+    """
+    executor = ThreadPoolExecutor(max_workers=FETCH_WORKERS)
+    try:
+        yield from executor.map(lambda path: fetch_file(repo, ref, path), paths)
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def map_lint_jobs(func, jobs):
     """
-    return len(get_py_files_in_pr(repo, pr_number)) > 0
+    Run func(*args) for every args of jobs in the pool of lint workers,
+    or in this process if the pool is disabled.
+
+    A job is submitted as soon as its arguments are available, and results
+    are returned in the order of jobs.
+    """
+    if LINT_WORKERS <= 0:
+        return [func(*args) for args in jobs]
+    return workers.get_pool().map(func, jobs)
+
+
+def git_blob_sha(text, encoding="utf-8"):
+    """Return the SHA of the git blob of a file"""
+    content = text.encode(encoding or "utf-8")
+    return hashlib.sha1(b"blob %d\0" % len(content) + content).hexdigest()
 
 
+def lint_files(repo, ref, paths, config, blob_shas=None):
+    """
+    Lint the files at ref with the linter of the config. Return a dictionary
+    of the paths paired with the (relevant, extra) tuple of linters.lint,
+    for the whole files.
+
+    Results are cached by path, SHA of the git blob of the file and linter
+    configuration. Files whose SHA is in blob_shas are not even downloaded
+    when their result is cached. Files which could not be downloaded are
+    left out.
+    """
+    if blob_shas is None:
+        blob_shas = {}
+    config_key = linters.result_key(config)
+    results = {}
+    keys = {}
+    for path in paths:
+        if blob_shas.get(path):
+            keys[path] = (path, blob_shas[path], config_key)
+            result = _lint_cache.get(keys[path])
+            if result is not cache.MISSING:
+                results[path] = result
+    to_fetch = [path for path in paths if path not in results]
+
+    to_lint = []
+
+    def downloaded_files():
+        for path, r in zip(to_fetch, fetch_files(repo, ref, to_fetch)):
+            if r.status_code != 200:
+                # Do not lint (and cache) an error page
+                logging.warning("Could not download %s of %s at %s: %s", path, repo, ref, r.status_code)
+                continue
+            if path not in keys:
+                keys[path] = (path, git_blob_sha(r.text, r.encoding), config_key)
+                result = _lint_cache.get(keys[path])
+                if result is not cache.MISSING:
+                    results[path] = result
+                    continue
+            to_lint.append(path)
+            yield path[1:], r.text, r.encoding
+
+    if config["scanner"]["engine"] == "subprocess" and config["scanner"].get("batch"):
+        # One run of the linter for all the files
+        batch_results = linters.lint_batch(list(downloaded_files()), config)
+        lint_results = [batch_results[path[1:]] for path in to_lint]
+    else:
+        # Lint the files as soon as they are downloaded
+        lint_results = map_lint_jobs(
+            linters.lint, ((filename, text, config, encoding) for filename, text, encoding in downloaded_files()))
+
+    for path, result in zip(to_lint, lint_results):
+        _lint_cache.set(keys[path], result)
+        results[path] = result
+    return results
+
+
+def changed_files(repo, base, head):
+    """
+    Return the set of the paths changed between the commits base and head,
+    or None when head is not a descendant of base (e.g. after a force push).
+    """
+    r = utils.query_request(f"/repos/{repo}/compare/{base}...{head}")
+    if r.status_code != 200:
+        return None
+    comparison = r.json()
+    if comparison["status"] not in ("ahead", "identical"):
+        return None
+    files = comparison.get("files", [])
+    if len(files) >= 300:  # The API lists 300 files at most
+        return None
+
+    paths = set()
+    for changed_file in files:
+        paths.add("/" + changed_file["filename"])
+        if changed_file.get("previous_filename"):
+            paths.add("/" + changed_file["previous_filename"])
+    return paths
+
+
+@metrics.timer("stage_seconds", stage="lint")
 def run_pycodestyle(ghrequest, config):
     """
-    Runs the linter cli tool on the files and update ghrequest
+    Runs the linter on the files and update ghrequest
+
+    When commits are pushed to a Pull Request, only the files changed since
+    the last analyzed head are linted, the results of the others are reused.
     """
     linter = config["scanner"]["linter"]  # Either pycodestyle or flake8
     repo = ghrequest.repository
-    pr_number = ghrequest.pr_number
     commit = ghrequest.after_commit_hash
 
     # Run linter
     ## All the python files with additions
     # A dictionary with filename paired with list of new line numbers
     files_to_exclude = config[linter]["exclude"]
-    py_files = get_py_files_in_pr(repo, pr_number, files_to_exclude)
-
+    py_files = ghrequest.pr_diff.py_files(files_to_exclude)
+
+    state_key = (repo, ghrequest.pr_number)
+    config_key = linters.result_key(config)
+    lint_results = {}
+    state = _pr_state.get(state_key)
+    if ghrequest.action == "synchronize" and state is not cache.MISSING and state[1] == config_key:
+        last_commit, _, last_results = state
+        changed = changed_files(repo, last_commit, commit)
+        if changed is not None:
+            lint_results = {path: result for path, result in last_results.items() if path not in changed}
+    metrics.inc("lint_runs_total", mode="incremental" if lint_results else "full")
+
+    to_lint = [py_file for py_file in py_files if py_file not in lint_results]
+    if to_lint:
+        # The listing of the PR files is only worth it when linting all of them
+        blob_shas = None if lint_results else ghrequest.pr_diff.blob_shas
+        lint_results.update(lint_files(repo, commit, to_lint, config, blob_shas))
+    # Files which could not be downloaded are linted again on the next event
+    linted = {py_file: lint_results[py_file] for py_file in py_files if py_file in lint_results}
+    _pr_state.set(state_key, (commit, config_key, linted))
+
+    diff_only = config["scanner"]["diff_only"]
     ghrequest.links = {}  # UI Link of each updated file in the PR
-    for py_file in py_files:
+    for py_file in linted:
+        errors, extra_results = lint_results[py_file]
         filename = py_file[1:]
-        query = f"https://raw.githubusercontent.com/{repo}/{commit}/{py_file}"
-        r = utils.query_request(query)
-        with open("file_to_check.py", 'w+', encoding=r.encoding) as file_to_check:
-            file_to_check.write(r.text)
-
-        # Use the command line here
-        if config["scanner"]["linter"] == "flake8":
-            cmd = f'flake8 {config["flake8_cmd_config"]} file_to_check.py'
-        else:
-            cmd = f'pycodestyle {config["pycodestyle_cmd_config"]} file_to_check.py'
-        proc = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE)
-        stdout, _ = proc.communicate()
-        ghrequest.extra_results[filename] = stdout.decode(r.encoding).splitlines()
+        ghrequest.extra_results[filename] = extra_results
 
         # Put only relevant errors in the ghrequest.results dictionary
-        ghrequest.results[filename] = []
-        for error in list(ghrequest.extra_results[filename]):
-            relevant_error_pattern = r"^file_to_check.py:\d+:\d+:\s[WEF]\d+\s.*"
-            # Other error codes are B C D T
-            if re.search(relevant_error_pattern, error):
-                ghrequest.results[filename].append(error.replace("file_to_check.py", filename))
-                ghrequest.extra_results[filename].remove(error)
-
-        # Replace file_to_check.py with filename in all additional errors
-        extras = ghrequest.extra_results[filename]
-        ghrequest.extra_results[filename] = [e.replace("file_to_check.py", filename) for e in extras]
-
-        ## Remove errors in case of diff_only = True
+        ## Leave out errors in case of diff_only = True
         ## which are caused in the whole file
-        for error in list(ghrequest.results[filename]):
-            if config["scanner"]["diff_only"]:
-                if not int(error.split(":")[1]) in py_files[py_file]:
-                    ghrequest.results[filename].remove(error)
+        added_lines = py_files[py_file]
+        ghrequest.results[filename] = [issue for issue in errors if not diff_only or issue.line in added_lines]
 
         ## Store the link to the file
         url = f"https://github.com/{repo}/blob/{commit}{py_file}"
         ghrequest.links[filename + "_link"] = url
-        os.remove("file_to_check.py")
 
 
 def prepare_comment(ghrequest, config):
@@ -295,22 +512,12 @@ def prepare_comment(ghrequest, config):
                 issues = issues[::-1]
 
             for issue in issues:
-                # Replace filename with L
-                error_string = issue.replace(gh_file + ":", "Line ")
-
                 # Link error codes to search query
-                error_string_list = error_string.split(" ")
-                code = error_string_list[2]
-                code_url = f"https://duckduckgo.com/?q=pep8%20{code}"
-                error_string_list[2] = f"[{code}]({code_url})"
-
+                code_url = f"https://duckduckgo.com/?q=pep8%20{issue.code}"
                 # Link line numbers in the file
-                line, col = error_string_list[1][:-1].split(":")
-                line_url = ghrequest.links[gh_file + "_link"] + "#L" + line
-                error_string_list[1] = f"[{line}:{col}]({line_url}):"
-                error_string = " ".join(error_string_list)
-                error_string = error_string.replace("Line [", "[Line ")
-                comment_body.append(f"\n> {error_string}")
+                line_url = f"{ghrequest.links[gh_file + '_link']}#L{issue.line}"
+                comment_body.append(
+                    f"\n> [Line {issue.line}:{issue.col}]({line_url}): [{issue.code}]({code_url}) {issue.message}")
 
         comment_body.append("\n\n")
         if ghrequest.extra_results[gh_file]:
@@ -400,6 +607,7 @@ def comment_permission_check(ghrequest):
     return True
 
 
+@metrics.timer("stage_seconds", stage="comment")
 def create_or_update_comment(ghrequest, comment, ONLY_UPDATE_COMMENT_BUT_NOT_CREATE):
     query = f"/repos/{ghrequest.repository}/issues/{str(ghrequest.pr_number)}/comments"
     comments = utils.query_request(query).json()
@@ -412,7 +620,7 @@ def create_or_update_comment(ghrequest, comment, ONLY_UPDATE_COMMENT_BUT_NOT_CRE
             break
 
     if last_comment_id is None and not ONLY_UPDATE_COMMENT_BUT_NOT_CREATE:  # Create a new comment
-        response = utils.query_request(query=query, method='POST', json={"body": comment})
+        response = utils.query_request(query=query, method='POST', json={"body": comment}, priority=client.HIGH)
         ghrequest.comment_response = response.json()
     else:  # Update the last comment
         utc_time = datetime.datetime.utcnow()
@@ -420,56 +628,62 @@ def create_or_update_comment(ghrequest, comment, ONLY_UPDATE_COMMENT_BUT_NOT_CRE
         comment += f"\n\n##### Comment last updated at {time_now!s}"
 
         query = f"/repos/{ghrequest.repository}/issues/comments/{str(last_comment_id)}"
-        response = utils.query_request(query, method='PATCH', json={"body": comment})
+        response = utils.query_request(query, method='PATCH', json={"body": comment}, priority=client.HIGH)
 
     return response
 
 
-def autopep8(ghrequest, config):
-    # Run pycodestyle
+@metrics.timer("stage_seconds", stage="fix")
+def fix_files(repo, sha, paths, config):
+    """
+    Fix the files at sha with autopep8 and the options of the linter of the
+    config. Return a dictionary of the paths paired with the tuple (fixed
+    text, diff) of the file. The files which could not be downloaded are
+    left out.
 
-    r = utils.query_request(ghrequest.diff_url)
-    ## All the python files with additions
-    patch = unidiff.PatchSet(r.content.splitlines(), encoding=r.encoding)
+    Fixes are kept for FIX_CACHE_TTL seconds by repository, commit, path and
+    options, so that `pep8ify` reuses the fixes of a `suggest diff`.
+    """
+    options = linters.fix_options(config)
+    options_key = linters.fix_key(options)
+    fixes = {}
+    for path in paths:
+        fix = _fix_cache.get((repo, sha, path, options_key))
+        if fix is not cache.MISSING:
+            fixes[path] = fix
+    to_fix = [path for path in paths if path not in fixes]
+
+    downloaded = []
+
+    def downloaded_files():
+        for path, r in zip(to_fix, fetch_files(repo, sha, to_fix)):
+            if r.status_code != 200:
+                # Do not fix (and commit) an error page
+                logging.warning("Could not download %s of %s at %s: %s", path, repo, sha, r.status_code)
+                continue
+            downloaded.append(path)
+            yield path[1:], r.text, options
+
+    fixed = map_lint_jobs(linters.fix, downloaded_files())
+    for path, fix in zip(downloaded, fixed):
+        _fix_cache.set((repo, sha, path, options_key), fix, ttl=FIX_CACHE_TTL)
+        fixes[path] = fix
+    return {path: fixes[path] for path in paths if path in fixes}
 
-    # A dictionary with filename paired with list of new line numbers
-    py_files = {}
-
-    for patchset in patch:
-        if patchset.target_file[-3:] == '.py':
-            py_file = patchset.target_file[1:]
-            py_files[py_file] = []
-            for hunk in patchset:
-                for line in hunk.target_lines():
-                    if line.is_added:
-                        py_files[py_file].append(line.target_line_no)
-
-    # Ignore errors and warnings specified in the config file
-    to_ignore = ",".join(config["pycodestyle"]["ignore"])
-    arg_to_ignore = ""
-    if len(to_ignore) > 0:
-        arg_to_ignore = "--ignore " + to_ignore
-
-    for py_file in py_files:
-        filename = py_file[1:]
-        url = f"https://raw.githubusercontent.com/{ghrequest.repository}/{ghrequest.sha}/{py_file}"
-        r = utils.query_request(url)
-        with open("file_to_fix.py", 'w+', encoding=r.encoding) as file_to_fix:
-            file_to_fix.write(r.text)
 
-        cmd = f'autopep8 file_to_fix.py --diff {arg_to_ignore}'
-        proc = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE)
-        stdout, _ = proc.communicate()
-        ghrequest.diff[filename] = stdout.decode(r.encoding)
+def autopep8(ghrequest, config):
+    ## All the python files with additions
+    # A dictionary with filename paired with list of new line numbers
+    py_files = ghrequest.pr_diff.py_files()
 
-        # Fix the errors
-        ghrequest.diff[filename] = ghrequest.diff[filename].replace("file_to_check.py", filename)
-        ghrequest.diff[filename] = ghrequest.diff[filename].replace("\\", "\\\\")
+    fixes = fix_files(ghrequest.repository, ghrequest.sha, list(py_files), config)
+    ghrequest.links = {}
+    for py_file, (_, file_diff) in fixes.items():
+        filename = py_file[1:]
+        ghrequest.diff[filename] = file_diff
 
         ## Store the link to the file
-        ghrequest.links = {}
         ghrequest.links[filename + "_link"] = f"https://github.com/{ghrequest.repository}/blob/{ghrequest.sha}{py_file}"
-        os.remove("file_to_fix.py")
 
 
 def create_gist(ghrequest):
@@ -492,49 +706,42 @@ def create_gist(ghrequest):
     ghrequest.gist_url = response["html_url"]
 
 
-def delete_if_forked(ghrequest):
-    FORKED = False
-    query = "/user/repos"
-    r = utils.query_request(query)
-    for repo in r.json():
-        if repo["description"]:
-            if ghrequest.target_repo_fullname in repo["description"]:
-                FORKED = True
-                url = f"/repos/{repo['full_name']}"
-                utils.query_request(url, method='DELETE')
-    return FORKED
-
-
 def fork_for_pr(ghrequest):
-    query = f"/repos/{ghrequest.target_repo_fullname}/forks"
+    """
+    Set ghrequest.fork_fullname to the fork of the target repository,
+    reusing the fork of the bot account when there is one.
+    """
+    upstream = ghrequest.target_repo_fullname
+    fork = forks.registry.get(upstream)
+    if fork is not None:
+        if utils.query_request(f"/repos/{fork}").status_code == 200:
+            ghrequest.fork_fullname = fork
+            return True
+        forks.registry.remove(upstream)  # Deleted since
+
+    query = f"/repos/{upstream}/forks"
     r = utils.query_request(query, method='POST')
+    if r.status_code != 202:
+        ghrequest.error = "Unable to fork"
+        return False
 
-    if r.status_code == 202:
-        ghrequest.fork_fullname = r.json()["full_name"]
-        return True
-
-    ghrequest.error = "Unable to fork"
-    return False
+    ghrequest.fork_fullname = r.json()["full_name"]
+    # Forking takes time
+    if not forks.wait_until_ready(ghrequest.fork_fullname):
+        ghrequest.error = "Forking is taking longer than usual"
+        return False
+    update_fork_desc(ghrequest)
+    forks.registry.add(upstream, ghrequest.fork_fullname)
+    return True
 
 
 def update_fork_desc(ghrequest):
-    # Check if forked (takes time)
+    """Describe the fork with its upstream repository, so that it is found again"""
     query = f"/repos/{ghrequest.fork_fullname}"
-    r = utils.query_request(query)
-    ATTEMPT = 0
-    while (r.status_code != 200):
-        time.sleep(5)
-        r = utils.query_request(query)
-        ATTEMPT += 1
-        if ATTEMPT > 10:
-            ghrequest.error = "Forking is taking longer than usual"
-            break
-
     full_name = ghrequest.target_repo_fullname
-    author, name = full_name.split("/")
     request_json = {
-        "name": name,
-        "description": f"Forked from @{author}'s {full_name}"
+        "name": full_name.split("/")[1],
+        "description": forks.describe(full_name),
     }
     r = utils.query_request(query, method='PATCH', data=json.dumps(request_json))
     if r.status_code != 200:
@@ -542,83 +749,126 @@ def update_fork_desc(ghrequest):
 
 
 def create_new_branch(ghrequest):
-    query = f"/repos/{ghrequest.fork_fullname}/git/refs/heads"
-    sha = None
-    r = utils.query_request(query)
-    for ref in r.json():
-        if ref["ref"].split("/")[-1] == ghrequest.target_repo_branch:
-            sha = ref["object"]["sha"]
-
-    query = f"/repos/{ghrequest.fork_fullname}/git/refs"
+    """Point the new branch of the fork at the head commit of the Pull Request"""
+    fullname = ghrequest.fork_fullname
     ghrequest.new_branch = f"{ghrequest.target_repo_branch}-pep8-patch"
-    request_json = {
-        "ref": f"refs/heads/{ghrequest.new_branch}",
-        "sha": sha,
-    }
-    r = utils.query_request(query, method='POST', json=request_json)
+    sha = ghrequest.pull_request["head"]["sha"]
+
+    def set_branch():
+        query = f"/repos/{fullname}/git/refs"
+        r = utils.query_request(query, method='POST', json={"ref": f"refs/heads/{ghrequest.new_branch}", "sha": sha})
+        if r.status_code == 422:  # The branch exists since an earlier pep8ify
+            query = f"/repos/{fullname}/git/refs/heads/{ghrequest.new_branch}"
+            r = utils.query_request(query, method='PATCH', json={"sha": sha, "force": True})
+        return r
+
+    r = set_branch()
+    if r.status_code == 422:
+        # The fork does not have the commit yet
+        query = f"/repos/{fullname}/merge-upstream"
+        utils.query_request(query, method='POST', json={"branch": ghrequest.target_repo_branch})
+        r = set_branch()
 
     if r.status_code > 299:
         ghrequest.error = "Could not create a new branch in the fork"
 
 
 def autopep8ify(ghrequest, config):
-    # Run pycodestyle
-    r = utils.query_request(ghrequest.diff_url)
-
     ## All the python files with additions
-    patch = unidiff.PatchSet(r.content.splitlines(), encoding=r.encoding)
-
     # A dictionary with filename paired with list of new line numbers
-    py_files = {}
-
-    for patchset in patch:
-        if patchset.target_file[-3:] == '.py':
-            py_file = patchset.target_file[1:]
-            py_files[py_file] = []
-            for hunk in patchset:
-                for line in hunk.target_lines():
-                    if line.is_added:
-                        py_files[py_file].append(line.target_line_no)
-
-    # Ignore errors and warnings specified in the config file
-    to_ignore = ",".join(config["pycodestyle"]["ignore"])
-    arg_to_ignore = ""
-    if len(to_ignore) > 0:
-        arg_to_ignore = "--ignore " + to_ignore
-
-    for py_file in py_files:
-        filename = py_file[1:]
-        query = f"https://raw.githubusercontent.com/{ghrequest.repository}/{ghrequest.sha}/{py_file}"
-        r = utils.query_request(query)
-        with open("file_to_fix.py", 'w+', encoding=r.encoding) as file_to_fix:
-            file_to_fix.write(r.text)
+    py_files = ghrequest.pr_diff.py_files()
+
+    fixes = fix_files(ghrequest.repository, ghrequest.sha, list(py_files), config)
+    for py_file, (fixed_file, _) in fixes.items():
+        ghrequest.results[py_file[1:]] = fixed_file
+
+
+def create_blob(repo, text):
+    """Create a git blob of the UTF-8 text in repo and return its SHA, or None"""
+    r = utils.query_request(f"/repos/{repo}/git/blobs", method='POST', json={"content": text, "encoding": "utf-8"})
+    if r.status_code != 201:
+        return None
+    return r.json()["sha"]
 
-        cmd = f'autopep8 file_to_fix.py {arg_to_ignore}'
-        proc = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE)
-        stdout, _ = proc.communicate()
-        ghrequest.results[filename] = stdout.decode(r.encoding)
 
-        os.remove("file_to_fix.py")
+def tree_entries(repo, commit_sha, tree_sha, paths):
+    """
+    Return the entries of the files at paths in the commit, keyed by path.
+
+    Only the directories of the paths are listed, not the whole tree of the
+    commit. The files of a directory which can not be listed, or which is
+    truncated by GitHub, are left out.
+    """
+    directories = sorted({posixpath.dirname(path) for path in paths})
+
+    def list_directory(directory):
+        tree = f"{commit_sha}:{quote(directory)}" if directory else tree_sha
+        r = utils.query_request(f"/repos/{repo}/git/trees/{tree}")
+        if r.status_code != 200 or r.json().get("truncated"):
+            return []
+        return [dict(entry, path=posixpath.join(directory, entry["path"])) for entry in r.json()["tree"]]
 
+    entries = {}
+    with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as executor:
+        for directory_entries in executor.map(list_directory, directories):
+            entries.update((entry["path"], entry) for entry in directory_entries)
+    return entries
 
+
+@metrics.timer("stage_seconds", stage="commit")
 def commit(ghrequest):
+    """
+    Commit all the fixed files onto the new branch of the fork at once,
+    with the Git Data API: the blobs are created concurrently, then a
+    single tree, commit and update of the branch.
+    """
     fullname = ghrequest.fork_fullname
+    r = utils.query_request(f"/repos/{fullname}/git/ref/heads/{ghrequest.new_branch}")
+    if r.status_code != 200:
+        ghrequest.error = "Could not find the new branch in the fork"
+        return
+    parent_sha = r.json()["object"]["sha"]
+    base_tree = utils.query_request(f"/repos/{fullname}/git/commits/{parent_sha}").json()["tree"]["sha"]
+
+    # Keep the mode of the files, and leave out the ones autopep8 did not change
+    entries = tree_entries(fullname, parent_sha, base_tree, ghrequest.results)
+    fixed_files = {
+        path: text for path, text in ghrequest.results.items()
+        if entries.get(path, {}).get("sha") != git_blob_sha(text)
+    }
+    if not fixed_files:
+        return
+
+    with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as executor:
+        blob_shas = list(executor.map(lambda text: create_blob(fullname, text), fixed_files.values()))
+    if None in blob_shas:
+        ghrequest.error = "Could not commit the fixes"
+        return
+
+    tree = [
+        {"path": path, "mode": entries.get(path, {}).get("mode", "100644"), "type": "blob", "sha": blob_sha}
+        for path, blob_sha in zip(fixed_files, blob_shas)
+    ]
+    r = utils.query_request(
+        f"/repos/{fullname}/git/trees", method='POST', json={"base_tree": base_tree, "tree": tree})
+    if r.status_code != 201:
+        ghrequest.error = "Could not commit the fixes"
+        return
 
-    for old_file, new_file in ghrequest.results.items():
-        query = f"/repos/{fullname}/contents/{old_file}"
-        params = {"ref": ghrequest.new_branch}
-        r = utils.query_request(query, params=params)
-        sha_blob = r.json().get("sha")
-        params["path"] = old_file
-        content_code = base64.b64encode(new_file.encode()).decode("utf-8")
-        request_json = {
-            "path": old_file,
-            "message": f"Fix PEP 8 errors in {old_file}",
-            "content": content_code,
-            "sha": sha_blob,
-            "branch": ghrequest.new_branch,
-        }
-        r = utils.query_request(query, method='PUT', json=request_json)
+    request_json = {
+        "message": "Fix PEP 8 errors",
+        "tree": r.json()["sha"],
+        "parents": [parent_sha],
+    }
+    r = utils.query_request(f"/repos/{fullname}/git/commits", method='POST', json=request_json)
+    if r.status_code != 201:
+        ghrequest.error = "Could not commit the fixes"
+        return
+
+    ref_query = f"/repos/{fullname}/git/refs/heads/{ghrequest.new_branch}"
+    r = utils.query_request(ref_query, method='PATCH', json={"sha": r.json()["sha"], "force": False})
+    if r.status_code != 200:
+        ghrequest.error = "Could not commit the fixes"
 
 
 def create_pr(ghrequest):
@@ -632,5 +882,12 @@ def create_pr(ghrequest):
     r = utils.query_request(query, method='POST', json=request_json)
     if r.status_code == 201:
         ghrequest.pr_url = r.json()["html_url"]
+        return
+
+    # Opened by an earlier pep8ify, the new commit is already in it
+    params = {"head": request_json["head"], "state": "open"}
+    r = utils.query_request(query, params=params)
+    if r.status_code == 200 and r.json():
+        ghrequest.pr_url = r.json()[0]["html_url"]
     else:
         ghrequest.error = "Pull request could not be created"
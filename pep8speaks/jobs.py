@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+"""
+Queue of webhook events handled in the background.
+
+The webhook endpoint only validates and enqueues the events, which are then
+processed by a pool of worker threads running the handlers. The queue is kept
+in memory by default, or in a SQLite database to survive restarts.
+"""
+from contextlib import closing
+import heapq
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from requests.structures import CaseInsensitiveDict
+
+from pep8speaks import coalesce, handlers, metrics
+from pep8speaks.constants import COALESCE_WINDOW, JOB_QUEUE_BACKEND, JOB_QUEUE_PATH, JOB_WORKERS
+
+# Events which are handled in the background, with the name of their handler
+ASYNC_EVENTS = {
+    "pull_request": "handle_pull_request",
+    "issue_comment": "handle_issue_comment",
+}
+
+
+class Job(object):
+    """
+    A webhook event waiting to be handled.
+
+    It has the json and headers attributes of a Flask request, so it can be
+    passed to the handlers in place of the request. Like the headers of a
+    request, the names of its headers are case insensitive.
+    """
+    def __init__(self, event, payload, headers, id=None, enqueued_at=None, not_before=None):
+        self.id = id
+        self.event = event
+        self.json = payload
+        self.headers = CaseInsensitiveDict(headers)
+        self.enqueued_at = time.time() if enqueued_at is None else enqueued_at
+        # The job is not started before this time
+        self.not_before = self.enqueued_at if not_before is None else not_before
+        # Pull Request of a pull_request event, whose jobs are coalesced
+        self.key = coalesce.key_of(event, payload)
+
+    @classmethod
+    def from_request(cls, request):
+        job = cls(request.headers["X-GitHub-Event"], request.json, dict(request.headers))
+        # Wait for a quiet window after a push, in case more commits are on their way
+        if job.key is not None and job.json.get("action") == "synchronize":
+            job.not_before += COALESCE_WINDOW
+        return job
+
+    @property
+    def sha(self):
+        if self.key is None:
+            return None
+        return self.json["pull_request"]["head"]["sha"]
+
+
+class MemoryQueue(object):
+    """Jobs kept in the memory of the process, ordered by their start time"""
+    def __init__(self):
+        self._heap = []
+        self._last_id = 0
+        self._available = threading.Condition()
+
+    def put(self, job, added=None):
+        """Add the job, calling added(job) once it has an id but before it can be got"""
+        with self._available:
+            self._last_id += 1
+            job.id = self._last_id
+            if added is not None:
+                added(job)
+            heapq.heappush(self._heap, (job.not_before, job.id, job))
+            self._available.notify()
+
+    def get(self, timeout=None):
+        deadline = time.monotonic() + (timeout or 0)
+        with self._available:
+            while True:
+                now = time.time()
+                if self._heap and self._heap[0][0] <= now:
+                    return heapq.heappop(self._heap)[2]
+                wait = deadline - time.monotonic()
+                if wait <= 0:
+                    return None
+                if self._heap:
+                    wait = min(wait, self._heap[0][0] - now)
+                self._available.wait(wait)
+
+    def done(self, job):
+        pass
+
+    def __len__(self):
+        with self._available:
+            return len(self._heap)
+
+
+class SQLiteQueue(object):
+    """
+    Jobs stored in a SQLite database, shared by the gunicorn workers.
+
+    Jobs which were running in a process which does not exist anymore are
+    queued again, so that no event is lost on a restart. Pending jobs of a
+    Pull Request are deleted when a newer one is added, whichever process
+    added them.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._available = threading.Condition()
+        with closing(self._connect()) as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, event TEXT, payload TEXT, headers TEXT, "
+                "enqueued_at REAL, not_before REAL DEFAULT 0, key TEXT, state TEXT DEFAULT 'pending', owner INTEGER)"
+            )
+        self._recover()
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    def _recover(self):
+        with closing(self._connect()) as db:
+            owners = db.execute("SELECT DISTINCT owner FROM jobs WHERE state = 'running'").fetchall()
+            for (owner, ) in owners:
+                if not _process_exists(owner):
+                    db.execute("UPDATE jobs SET state = 'pending', owner = NULL WHERE owner = ?", (owner, ))
+
+    def put(self, job, added=None):
+        key = None if job.key is None else json.dumps(job.key)
+        with closing(self._connect()) as db:
+            # Workers cannot get the job before the end of the transaction
+            db.execute("BEGIN IMMEDIATE")
+            cursor = db.execute(
+                "INSERT INTO jobs (event, payload, headers, enqueued_at, not_before, key) VALUES (?, ?, ?, ?, ?, ?)",
+                (job.event, json.dumps(job.json), json.dumps(dict(job.headers)), job.enqueued_at, job.not_before, key),
+            )
+            job.id = cursor.lastrowid
+            if key is not None:
+                db.execute("DELETE FROM jobs WHERE key = ? AND state = 'pending' AND id < ?", (key, job.id))
+            if added is not None:
+                added(job)
+            db.execute("COMMIT")
+        with self._available:
+            self._available.notify()
+
+    def _pop(self):
+        with closing(self._connect()) as db:
+            db.execute("BEGIN IMMEDIATE")
+            row = db.execute(
+                "SELECT id, event, payload, headers, enqueued_at, not_before FROM jobs "
+                "WHERE state = 'pending' AND not_before <= ? ORDER BY not_before, id LIMIT 1",
+                (time.time(), )
+            ).fetchone()
+            if row is None:
+                db.execute("COMMIT")
+                return None
+            db.execute("UPDATE jobs SET state = 'running', owner = ? WHERE id = ?", (os.getpid(), row[0]))
+            db.execute("COMMIT")
+        id, event, payload, headers, enqueued_at, not_before = row
+        return Job(event, json.loads(payload), json.loads(headers),
+                   id=id, enqueued_at=enqueued_at, not_before=not_before)
+
+    def get(self, timeout=None):
+        # Other processes can add jobs too, so poll the database regularly
+        deadline = time.monotonic() + (timeout or 0)
+        while True:
+            job = self._pop()
+            if job is not None:
+                return job
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            with self._available:
+                self._available.wait(min(remaining, 1))
+
+    def done(self, job):
+        with closing(self._connect()) as db:
+            db.execute("DELETE FROM jobs WHERE id = ?", (job.id, ))
+
+    def __len__(self):
+        with closing(self._connect()) as db:
+            return db.execute("SELECT COUNT(*) FROM jobs WHERE state = 'pending'").fetchone()[0]
+
+
+def _process_exists(pid):
+    if pid is None:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _register(job):
+    if job.key is not None:
+        coalesce.register(job.key, job.id, job.sha)
+
+
+class JobQueue(object):
+    """A queue of jobs with its pool of worker threads"""
+    def __init__(self, backend, workers=JOB_WORKERS):
+        self.backend = backend
+        self.workers = []
+        for _ in range(workers):
+            worker = threading.Thread(target=self._work, daemon=True)
+            worker.start()
+            self.workers.append(worker)
+
+    def submit(self, job):
+        # Registered as the newest job of its Pull Request before a worker can get it
+        self.backend.put(job, added=_register)
+        metrics.inc("jobs_enqueued_total", event=job.event)
+        metrics.set_gauge("job_queue_depth", len(self.backend))
+        return job
+
+    def _work(self):
+        while True:
+            job = self.backend.get(timeout=5)
+            if job is None:
+                continue
+            metrics.set_gauge("job_queue_depth", len(self.backend))
+            if job.key is not None and coalesce.is_superseded(job.key, job.id):
+                # A newer commit was pushed to the Pull Request, its job does the work
+                self.backend.done(job)
+                metrics.inc("jobs_total", event=job.event, outcome="superseded")
+                continue
+            self.run(job)
+
+    def run(self, job):
+        started_at = time.time()
+        metrics.observe("job_wait_seconds", started_at - job.enqueued_at, event=job.event)
+        outcome = "done"
+        try:
+            handler = getattr(handlers, ASYNC_EVENTS[job.event])
+            handler(job)
+        except Exception:
+            outcome = "failed"
+            logging.exception(f"Job {job.id} for a {job.event} event failed")
+        finally:
+            self.backend.done(job)
+            if job.key is not None:
+                coalesce.forget(job.key, job.id)
+        finished_at = time.time()
+        metrics.observe("job_run_seconds", finished_at - started_at, event=job.event)
+        metrics.observe("job_latency_seconds", finished_at - job.enqueued_at, event=job.event)
+        metrics.inc("jobs_total", event=job.event, outcome=outcome)
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_queue():
+    """Return the queue of this process, starting its workers on first use"""
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            if JOB_QUEUE_BACKEND == "sqlite":
+                backend = SQLiteQueue(JOB_QUEUE_PATH)
+            else:
+                backend = MemoryQueue()
+            _queue = JobQueue(backend)
+    return _queue
+
+
+def enqueue(request):
+    """Add the webhook event of the request to the queue"""
+    return get_queue().submit(Job.from_request(request))
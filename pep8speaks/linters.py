@@ -0,0 +1,305 @@
+# -*- coding: utf-8 -*-
+"""
+Lint engines used by run_pycodestyle.
+
+The in-process engine drives pycodestyle and flake8 through their Python API
+on the downloaded source text, so that no interpreter is started per file.
+The subprocess engine keeps the historical behaviour of calling the command
+line tools and is selectable with `scanner.engine` in .pep8speaks.yml. With
+`scanner.batch`, it runs the tool once for all the files of a Pull Request.
+
+autopep8 fixes the files through its Python API as well.
+"""
+import difflib
+import re
+import shlex
+import subprocess
+import threading
+
+import flake8
+import pycodestyle
+from flake8.api import legacy as flake8_legacy
+from flake8.formatting.base import BaseFormatter
+from flake8.main.application import Application as Flake8Application
+from flake8.options.parse_args import parse_args as flake8_parse_args
+from pep8speaks import scratch
+from pep8speaks.models import LintIssue
+
+# Other error codes are B C D T
+RELEVANT_CODE_PATTERN = re.compile(r"^[WEF]\d+$")
+OUTPUT_PATTERN = re.compile(r"^(?P<path>.+?):(?P<line>\d+):(?P<col>\d+):\s(?P<code>\w+)\s(?P<text>.*)$")
+
+# Keys of the linter sections which change the result of the checks.
+# The remaining ones (count, statistics, show-source...) only affect the output.
+CHECK_KEYS = ["max-line-length", "ignore", "select", "hang-closing", "first"]
+
+_local = threading.local()
+
+# Checks of pycodestyle. autopep8, imported later in fix, replaces some of them
+# in the registry of pycodestyle, which would change the reported errors.
+_PYCODESTYLE_CHECKS = {kind: dict(checks) for kind, checks in pycodestyle._checks.items()}
+
+
+class _PycodestyleStyleGuide(pycodestyle.StyleGuide):
+    """Style guide running the checks of pycodestyle, like the command line tool"""
+
+    def get_checks(self, argument_name):
+        checks = []
+        for check, (codes, args) in _PYCODESTYLE_CHECKS[argument_name].items():
+            if any(not (code and self.ignore_code(code)) for code in codes):
+                checks.append((check.__name__, check, args))
+        return sorted(checks)
+
+
+class _PycodestyleReport(pycodestyle.BaseReport):
+    """Collect the errors instead of printing them"""
+
+    def __init__(self, options):
+        super().__init__(options)
+        self._repeat = options.repeat
+        self.errors = []
+
+    def error(self, line_number, offset, text, check):
+        code = super().error(line_number, offset, text, check)
+        if code and (self.counters[code] == 1 or self._repeat):
+            self.errors.append(LintIssue(self.filename, line_number, offset + 1, code, text[5:]))
+        return code
+
+
+class _Flake8Formatter(BaseFormatter):
+    """Collect the violations instead of writing them"""
+
+    def after_init(self):
+        self.errors = []
+
+    def handle(self, error):
+        self.errors.append((error.line_number, error.column_number, error.code, error.text))
+
+    def issues(self, filename):
+        return [LintIssue(filename, *error) for error in self.errors]
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+
+def linter_options(config, linter):
+    """
+    Return the keyword arguments of the linter's style guide from the config.
+
+    Like the command line arguments built in get_config, only non empty
+    values are used so that the linters fall back to their own defaults.
+    """
+    options = {}
+    for key in CHECK_KEYS:
+        value = config[linter].get(key)
+        if not value:
+            continue
+        if key == "first":
+            options["repeat"] = False
+        elif isinstance(value, list):
+            options[key.replace("-", "_")] = tuple(value)
+        else:
+            options[key.replace("-", "_")] = value
+    return options
+
+
+def _flake8_application(options):
+    """
+    Return a flake8 application with the options and plugins, whose
+    _Flake8Formatter collects the errors.
+
+    Same as flake8_legacy.get_style_guide, except that the configuration files
+    in the working directory of the server (like its setup.cfg) are not read.
+    """
+    application = Flake8Application()
+    application.plugins, application.options = flake8_parse_args(["--isolated"])
+    for key, value in options.items():
+        if key != "repeat":
+            setattr(application.options, key, list(value) if isinstance(value, tuple) else value)
+    application.formatter = _Flake8Formatter(application.options)
+    return application
+
+
+def _style_guide(linter, options):
+    """
+    Return a style guide (a flake8 application for flake8) of this thread,
+    reused between files with the same options
+    """
+    guides = getattr(_local, "guides", None)
+    if guides is None:
+        guides = _local.guides = {}
+
+    key = (linter, tuple(sorted(options.items())))
+    if key not in guides:
+        if linter == "flake8":
+            guides[key] = _flake8_application(options)
+        else:
+            guides[key] = _PycodestyleStyleGuide(
+                parse_argv=False, config_file=False, reporter=_PycodestyleReport, **options)
+    return guides[key]
+
+
+def _lint_pycodestyle(filename, source, options):
+    style = _style_guide("pycodestyle", options)
+    report = style.init_report()
+    lines = source.splitlines(True)
+    pycodestyle.Checker(filename, lines=lines, options=style.options, report=report).check_all()
+    # Same order as the command line tool
+    report.errors.sort(key=lambda issue: (issue.line, issue.col, issue.code, issue.message))
+    return report.errors
+
+
+def _lint_flake8(filename, source, options):
+    application = _style_guide("flake8", options)
+    application.formatter.errors = []
+    # A new guide for each file, which does not keep the statistics of the previous files
+    application.make_guide()
+    application.make_file_checker_manager([])
+    with scratch.directory() as tmpdir:
+        flake8_legacy.StyleGuide(application).check_files([scratch.write(tmpdir, filename, source)])
+    return application.formatter.issues(filename)
+
+
+def _run_subprocess(files, config):
+    """
+    Run the linter command line tool once on the files, a list of
+    (filename, source, encoding) tuples. Return the found errors as a list of
+    LintIssue, and the lines of the output which are not errors.
+    """
+    linter = config["scanner"]["linter"]
+    with scratch.directory() as tmpdir:
+        for filename, source, encoding in files:
+            scratch.write(tmpdir, filename, source, encoding)
+        # Run from the scratch directory so that the output has the relative paths.
+        # The paths come after "--", a file named like an option is not read as one.
+        cmd = [linter, *shlex.split(config[f"{linter}_cmd_config"]), "--"]
+        cmd.extend(filename for filename, _, _ in files)
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, cwd=tmpdir)
+        stdout, _ = proc.communicate()
+
+    errors, unparsed = [], []
+    for output_line in stdout.decode(files[0][2], errors="replace").splitlines():
+        match = OUTPUT_PATTERN.match(output_line)
+        if match:
+            path = match["path"][2:] if match["path"].startswith("./") else match["path"]
+            errors.append(LintIssue(path, int(match["line"]), int(match["col"]), match["code"], match["text"]))
+        else:
+            unparsed.append(output_line)
+    return errors, unparsed
+
+
+def result_key(config):
+    """
+    Return a key of what changes the result of lint for a file: the linter,
+    its version, the engine and the linter arguments of the config.
+    """
+    linter = config["scanner"]["linter"]
+    version = flake8.__version__ if linter == "flake8" else pycodestyle.__version__
+    arguments = " ".join(sorted(config[f"{linter}_cmd_config"].split()))
+    return linter, version, config["scanner"].get("engine"), arguments
+
+
+def lint(filename, source, config, encoding="utf-8"):
+    """
+    Lint the source text of filename with the linter and engine of the config.
+
+    Return a tuple (relevant, extra). relevant is a list of LintIssue with
+    [WEF] error codes, extra is a list of strings for the remaining output
+    of the linter.
+    """
+    linter = config["scanner"]["linter"]  # Either pycodestyle or flake8
+
+    if config["scanner"].get("engine") == "subprocess":
+        errors, extra = _run_subprocess([(filename, source, encoding)], config)
+    else:
+        options = linter_options(config, linter)
+        if linter == "flake8":
+            errors = _lint_flake8(filename, source, options)
+        else:
+            errors = _lint_pycodestyle(filename, source, options)
+        extra = []
+
+    relevant = []
+    for issue in errors:
+        if RELEVANT_CODE_PATTERN.match(issue.code):
+            relevant.append(issue)
+        else:
+            extra.append(str(issue))
+    return relevant, extra
+
+
+def lint_batch(files, config):
+    """
+    Lint all the files with a single run of the linter command line tool,
+    so that the interpreter and the plugins are loaded once (and flake8 can
+    check the files in parallel with its --jobs option).
+
+    files is a list of (filename, source, encoding) tuples. Return a
+    dictionary of the filenames paired with the (relevant, extra) tuple
+    returned by lint.
+    """
+    results = {filename: ([], []) for filename, _, _ in files}
+    if not files:
+        return results
+
+    errors, unparsed = _run_subprocess(files, config)
+    for issue in errors:
+        if issue.path not in results:
+            continue
+        relevant, extra = results[issue.path]
+        if RELEVANT_CODE_PATTERN.match(issue.code):
+            relevant.append(issue)
+        else:
+            extra.append(str(issue))
+    # Give the remaining output to the file it is about, if any
+    for output_line in unparsed:
+        for filename in results:
+            if output_line.startswith((filename, f"./{filename}")):
+                results[filename][1].append(output_line)
+                break
+    return results
+
+
+def fix_options(config):
+    """
+    Return the autopep8 options of the config: the ignored and selected
+    codes and the maximum line length of its linter.
+    """
+    linter_config = config[config["scanner"]["linter"]]
+    options = {"max_line_length": int(linter_config["max-line-length"])}
+    # autopep8 has its own defaults for empty lists
+    for name in ("ignore", "select"):
+        if linter_config.get(name):
+            options[name] = list(linter_config[name])
+    return options
+
+
+def fix_key(options):
+    """Return a key of what changes the fixes of a file: the version of autopep8 and its options"""
+    import autopep8
+    return autopep8.__version__, repr(sorted(options.items()))
+
+
+def fix(filename, source, options=None):
+    """
+    Fix the source text of filename with autopep8 and the options of
+    fix_options. Return the fixed text and its unified diff.
+    """
+    import autopep8
+    fixed = autopep8.fix_code(source, options=dict(options or {}))
+    diff = []
+    for line in difflib.unified_diff(
+            source.splitlines(True), fixed.splitlines(True), "original/" + filename, "fixed/" + filename):
+        diff.append(line)
+        if not line.endswith("\n"):
+            diff.append("\n\\ No newline at end of file\n")
+    return fixed, "".join(diff)
+
+
+def warm_up():
+    """Load the linters and their plugins, before the first file to lint"""
+    _style_guide("pycodestyle", {})
+    _style_guide("flake8", {})
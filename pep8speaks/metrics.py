@@ -0,0 +1,311 @@
+# -*- coding: utf-8 -*-
+"""
+Counters, gauges and histograms collected by the server.
+
+Metrics are identified by their name and a set of labels, e.g.
+inc("jobs_total", event="pull_request", outcome="done").
+
+They are served in the Prometheus text format at /metrics. Every gunicorn
+worker has its own metrics, so with METRICS_DIR set, each process writes
+its snapshot in a JSON file of the directory every METRICS_INTERVAL
+seconds, and the worker answering /metrics merges the files of all the
+processes. Counters and histograms are summed, gauges get a pid label.
+The snapshot of an exited worker is kept without its gauges.
+"""
+import bisect
+import contextlib
+import copy
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+from pep8speaks.constants import METRICS_DIR, METRICS_INTERVAL
+
+# Upper bounds of the histogram buckets, in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+_lock = threading.Lock()
+_counters = {}
+_gauges = {}
+_histograms = {}
+# Functions updating metrics which are only known on demand
+_collectors = []
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def inc(name, value=1, **labels):
+    """Increment a counter"""
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def set_gauge(name, value, **labels):
+    """Set the current value of a gauge"""
+    with _lock:
+        _gauges[_key(name, labels)] = value
+
+
+def observe(name, value, **labels):
+    """Record a value (generally a duration in seconds) in a histogram"""
+    key = _key(name, labels)
+    with _lock:
+        if key not in _histograms:
+            _histograms[key] = {"buckets": [0] * (len(DEFAULT_BUCKETS) + 1), "sum": 0.0, "count": 0}
+        histogram = _histograms[key]
+        histogram["buckets"][bisect.bisect_left(DEFAULT_BUCKETS, value)] += 1
+        histogram["sum"] += value
+        histogram["count"] += 1
+
+
+def register_collector(collector):
+    """Register a function called before taking a snapshot of the metrics"""
+    _collectors.append(collector)
+
+
+def snapshot():
+    """Return a copy of all the metrics of this process"""
+    for collector in _collectors:
+        collector()
+    with _lock:
+        return {
+            "counters": dict(_counters),
+            "gauges": dict(_gauges),
+            "histograms": copy.deepcopy(_histograms),
+        }
+
+
+def reset():
+    """Forget all the metrics"""
+    with _lock:
+        _counters.clear()
+        _gauges.clear()
+        _histograms.clear()
+
+
+@contextlib.contextmanager
+def timer(name, **labels):
+    """Observe the seconds spent in the with block in a histogram"""
+    started_at = time.monotonic()
+    try:
+        yield
+    finally:
+        observe(name, time.monotonic() - started_at, **labels)
+
+
+def _dump(metrics):
+    """Convert a snapshot to a JSON compatible dictionary"""
+    return {
+        kind: [[name, dict(labels), value] for (name, labels), value in metrics[kind].items()]
+        for kind in ("counters", "gauges", "histograms")
+    }
+
+
+def _load(data):
+    return {
+        kind: {_key(name, labels): value for name, labels, value in data.get(kind, [])}
+        for kind in ("counters", "gauges", "histograms")
+    }
+
+
+def _snapshot_path(directory, pid):
+    return os.path.join(directory, f"{pid}.json")
+
+
+def _write_json(path, data):
+    # Write in a temporary file first, so that readers never see a partial file
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, "w") as snapshot_file:
+        json.dump(data, snapshot_file)
+    os.replace(tmp_path, path)
+
+
+def _read_json(path):
+    try:
+        with open(path) as snapshot_file:
+            return _load(json.load(snapshot_file))
+    except (OSError, ValueError):
+        return None
+
+
+def write_snapshot(directory=METRICS_DIR):
+    """Write the snapshot of this process in directory"""
+    os.makedirs(directory, exist_ok=True)
+    _write_json(_snapshot_path(directory, os.getpid()), _dump(snapshot()))
+
+
+def flush():
+    """Write the snapshot of this process in METRICS_DIR now, if set"""
+    if METRICS_DIR:
+        write_snapshot(METRICS_DIR)
+
+
+def clear_directory(directory=METRICS_DIR):
+    """Delete the snapshots of a previous run of the server"""
+    if not directory or not os.path.isdir(directory):
+        return
+    for entry in os.scandir(directory):
+        if entry.name.endswith((".json", ".tmp")):
+            os.remove(entry.path)
+
+
+def _merge(total, metrics, pid=None):
+    for key, value in metrics["counters"].items():
+        total["counters"][key] = total["counters"].get(key, 0) + value
+    for (name, labels), value in metrics["gauges"].items():
+        if pid is not None:
+            labels = tuple(sorted(labels + (("pid", str(pid)), )))
+        total["gauges"][name, labels] = value
+    for key, histogram in metrics["histograms"].items():
+        if key not in total["histograms"]:
+            total["histograms"][key] = copy.deepcopy(histogram)
+            continue
+        merged = total["histograms"][key]
+        merged["buckets"] = [a + b for a, b in zip(merged["buckets"], histogram["buckets"])]
+        merged["sum"] += histogram["sum"]
+        merged["count"] += histogram["count"]
+
+
+def aggregate(snapshots):
+    """
+    Merge the snapshots of several processes, given as (pid, snapshot)
+    pairs. pid is None for the snapshot of the exited processes.
+    """
+    total = {"counters": {}, "gauges": {}, "histograms": {}}
+    for pid, metrics in snapshots:
+        _merge(total, metrics, pid)
+    return total
+
+
+def collect(directory=METRICS_DIR):
+    """Return the metrics of all the processes writing in directory, or of this process only"""
+    if not directory:
+        return snapshot()
+
+    write_snapshot(directory)
+    snapshots = []
+    for entry in os.scandir(directory):
+        name, extension = os.path.splitext(entry.name)
+        if extension != ".json":
+            continue
+        metrics = _read_json(entry.path)
+        if metrics is not None:
+            snapshots.append((int(name) if name.isdigit() else None, metrics))
+    return aggregate(snapshots)
+
+
+def mark_process_dead(pid, directory=METRICS_DIR):
+    """
+    Merge the counters and histograms of an exited process in the snapshot
+    of the exited processes, and forget its gauges.
+    """
+    if not directory:
+        return
+    path = _snapshot_path(directory, pid)
+    metrics = _read_json(path)
+    if metrics is None:
+        return
+    dead_path = os.path.join(directory, "dead.json")
+    dead = _read_json(dead_path) or {"counters": {}, "gauges": {}, "histograms": {}}
+    metrics["gauges"] = {}
+    _write_json(dead_path, _dump(aggregate([(None, dead), (None, metrics)])))
+    os.remove(path)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _hit_ratios(counters):
+    """cache_hit_ratio gauges computed from the cache_requests_total counters"""
+    requests = {}
+    for (name, labels), value in counters.items():
+        if name == "cache_requests_total":
+            labels = dict(labels)
+            hits, total = requests.get(labels["cache"], (0, 0))
+            requests[labels["cache"]] = (hits + (value if labels["result"] == "hit" else 0), total + value)
+    return {
+        ("cache_hit_ratio", (("cache", name), )): hits / total
+        for name, (hits, total) in requests.items() if total
+    }
+
+
+def render(metrics):
+    """Return the metrics in the Prometheus text format"""
+    lines = []
+    gauges = dict(metrics["gauges"])
+    gauges.update(_hit_ratios(metrics["counters"]))
+
+    for kind, entries in (("counter", metrics["counters"]), ("gauge", gauges)):
+        last_name = None
+        for (name, labels), value in sorted(entries.items()):
+            if name != last_name:
+                lines.append(f"# TYPE {name} {kind}")
+                last_name = name
+            lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+    last_name = None
+    for (name, labels), histogram in sorted(metrics["histograms"].items()):
+        if name != last_name:
+            lines.append(f"# TYPE {name} histogram")
+            last_name = name
+        cumulative = 0
+        for bound, count in zip(DEFAULT_BUCKETS + (float("inf"), ), histogram["buckets"]):
+            cumulative += count
+            bucket_labels = labels + (("le", _format_value(float(bound))), )
+            lines.append(f"{name}_bucket{_format_labels(bucket_labels)} {cumulative}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(histogram['sum'])}")
+        lines.append(f"{name}_count{_format_labels(labels)} {histogram['count']}")
+    return "\n".join(lines) + "\n"
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def _write_periodically():
+    while True:
+        time.sleep(METRICS_INTERVAL)
+        try:
+            write_snapshot()
+        except OSError:
+            logging.exception("Could not write the metrics in %s", METRICS_DIR)
+
+
+def start_writer():
+    """Write the snapshot of this process in METRICS_DIR periodically, if set"""
+    global _writer
+    if not METRICS_DIR:
+        return
+    with _writer_lock:
+        if _writer is None:
+            _writer = threading.Thread(target=_write_periodically, daemon=True)
+            _writer.start()
+
+
+def _reset_writer():
+    # Threads are not inherited by a forked process
+    global _writer, _writer_lock
+    _writer = None
+    _writer_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_writer)
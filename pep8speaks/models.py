@@ -1,4 +1,36 @@
-from pep8speaks import utils
+from collections import namedtuple
+
+from pep8speaks import diff, utils
+
+# A file downloaded from raw.githubusercontent.com
+RawFile = namedtuple("RawFile", ["status_code", "text", "encoding"])
+
+
+class LintIssue(object):
+    """An error reported by a linter, at line and col (both starting at 1) of path"""
+    __slots__ = ("path", "line", "col", "code", "message")
+
+    def __init__(self, path, line, col, code, message):
+        self.path = path
+        self.line = line
+        self.col = col
+        self.code = code
+        self.message = message
+
+    def __str__(self):
+        # Same as the output of the linters
+        return f"{self.path}:{self.line}:{self.col}: {self.code} {self.message}"
+
+    def __repr__(self):
+        return f"LintIssue({self})"
+
+    def __eq__(self, other):
+        if not isinstance(other, LintIssue):
+            return NotImplemented
+        return all(getattr(self, slot) == getattr(other, slot) for slot in self.__slots__)
+
+    def __hash__(self):
+        return hash((self.path, self.line, self.col, self.code))
 
 
 class GHRequest(object):
@@ -83,6 +115,8 @@ class GHRequest(object):
         self.commits_url = self.pull_request['commits_url']
         self.base_branch = self.pull_request['base']['ref']
         self.after_commit_hash = self.pull_request['head']['sha']
+        # Downloaded on first use, and shared by all the helpers
+        self.pr_diff = diff.PullRequestDiff(self.repository, self.pr_number)
 
     def _set_conditionals(self, request, event):
         """
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""
+Scratch directories where the files of a job are written for the tools which
+only work on files (the linters command line and autopep8).
+
+Every job gets its own directory, so that jobs can run at the same time, and
+files keep their relative path in the repository, so that the `exclude` and
+`filename` patterns of the linters work. Directories are created in tmpfs
+(/dev/shm) when available, to stay off the disk.
+"""
+import contextlib
+import os
+import tempfile
+
+from pep8speaks.constants import SCRATCH_DIR
+
+_root = None
+
+
+def root():
+    """Return the directory in which scratch directories are created"""
+    global _root
+    if _root is None:
+        _root = SCRATCH_DIR
+        if not _root and os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK | os.X_OK):
+            _root = "/dev/shm"
+    # An empty string means the default temporary directory
+    return _root or None
+
+
+@contextlib.contextmanager
+def directory():
+    """Create a scratch directory, deleted with its content at the end"""
+    with tempfile.TemporaryDirectory(prefix="pep8speaks-", dir=root()) as path:
+        yield path
+
+
+def write(directory, filename, text, encoding="utf-8"):
+    """Write text at the relative path filename of directory and return its full path"""
+    directory = os.path.abspath(directory)
+    path = os.path.normpath(os.path.join(directory, filename))
+    if os.path.commonpath([directory, path]) != directory:
+        raise ValueError(f"{filename} is outside of the scratch directory")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding=encoding) as scratch_file:
+        scratch_file.write(text)
+    return path
@@ -5,7 +5,7 @@ import os
 
 from flask import abort
 from flask import Response as FResponse
-import requests
+from pep8speaks import client
 from pep8speaks.constants import GITHUB_TOKEN, BASE_URL
 try:
     from collections.abc import Mapping
@@ -18,26 +18,31 @@ def query_request(query=None, method="GET", **kwargs):
     Queries like /repos/:id needs to be appended to the base URL,
     Queries like https://raw.githubusercontent.com need not.
 
+    The request is sent with the pooled session of pep8speaks.client.
     full list of kwargs see http://docs.python-requests.org/en/master/api/#requests.request
     """
 
     if query[0] == "/":
         query = BASE_URL + query
 
-    request_kwargs = {
-        "headers": {"Authorization": f"Bearer {GITHUB_TOKEN}"}
-    }
+    headers = {"Authorization": f"Bearer {GITHUB_TOKEN}"}
+    headers.update(kwargs.pop("headers", None) or {})
 
-    for kw in kwargs:
-        request_kwargs["headers"].update(kwargs[kw])
-    return requests.request(method, query, **request_kwargs)
+    return client.request(method, query, headers=headers, **kwargs)
+
+
+def _serialize(obj):
+    """Serialize objects like GHRequest, leaving out their private attributes"""
+    if not hasattr(obj, "__dict__"):
+        return str(obj)
+    return {key: value for key, value in vars(obj).items() if not key.startswith("_")}
 
 
 def Response(data=None, status=200, mimetype='application/json'):
     if data is None:
         data = {}
 
-    response_object = json.dumps(data, default=lambda obj: obj.__dict__)
+    response_object = json.dumps(data, default=_serialize)
     return FResponse(response_object, status=status, mimetype=mimetype)
 
 
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""
+Pool of long-lived processes running the lint and fix jobs.
+
+The processes are started once (by the post_worker_init hook of gunicorn, or
+on first use) with the linters and their plugins already loaded, and receive
+jobs over a pipe. A process is replaced after max_jobs jobs, to release the
+memory it may have accumulated, and killed when a job takes longer than
+the timeout.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+
+from pep8speaks.constants import LINT_MAX_JOBS, LINT_TIMEOUT, LINT_WORKERS
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+class WorkerTimeout(Exception):
+    """Raised when a job takes longer than the timeout of the pool"""
+
+
+def _serve(conn):
+    """Main loop of a worker process"""
+    from pep8speaks import linters
+    linters.warm_up()
+    conn.send("ready")
+
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):  # The server is gone
+            break
+        if message is None:
+            break
+
+        func, args = message
+        try:
+            result = (True, func(*args))
+        except Exception as exc:
+            result = (False, exc)
+        try:
+            conn.send(result)
+        except Exception as exc:  # The result or the exception can not be pickled
+            conn.send((False, RuntimeError(repr(exc))))
+    conn.close()
+
+
+class _Worker(object):
+    def __init__(self, context):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_serve, args=(child_conn, ), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.ready = False
+        self.jobs = 0
+
+    def run(self, func, args, timeout):
+        """Return the (success, result or exception) tuple of func(*args) in the process"""
+        if not self.ready:
+            # The start of the process does not count in the timeout
+            self.conn.recv()
+            self.ready = True
+        self.jobs += 1
+        self.conn.send((func, args))
+        if not self.conn.poll(timeout):
+            raise WorkerTimeout(f"{func.__name__} did not finish in {timeout} seconds")
+        return self.conn.recv()
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.process.join(1)
+        if self.process.is_alive():
+            self.kill()
+        self.conn.close()
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+
+class Pool(object):
+    """
+    A pool of size worker processes.
+
+    Jobs are functions and arguments which can be pickled, the functions
+    being importable by the workers.
+    """
+    def __init__(self, size=LINT_WORKERS, max_jobs=LINT_MAX_JOBS, timeout=LINT_TIMEOUT):
+        self.size = size
+        self.max_jobs = max_jobs
+        self.timeout = timeout
+        # Fresh interpreters, which do not inherit the threads and sockets of the server
+        self._context = multiprocessing.get_context("spawn")
+        self._idle = queue.Queue()
+        for _ in range(size):
+            self._idle.put(_Worker(self._context))
+
+    def _renew(self, worker):
+        if worker is not None and worker.jobs < self.max_jobs:
+            return worker
+        if worker is not None:
+            worker.stop()
+        return _Worker(self._context)
+
+    def apply(self, func, *args):
+        """Run func(*args) in an idle worker and return its result"""
+        worker = self._idle.get()
+        try:
+            success, result = worker.run(func, args, self.timeout)
+        except BaseException:
+            # The worker may still be busy with the job, or dead
+            logging.warning("Replacing lint worker %s", worker.process.pid)
+            worker.kill()
+            worker = None
+            raise
+        finally:
+            self._idle.put(self._renew(worker))
+
+        if not success:
+            raise result
+        return result
+
+    def map(self, func, jobs):
+        """
+        Run func(*args) for every args of jobs in the workers.
+
+        A job is submitted as soon as its arguments are available, and results
+        are returned in the order of jobs.
+        """
+        with ThreadPoolExecutor(max_workers=self.size) as executor:
+            futures = [executor.submit(self.apply, func, *args) for args in jobs]
+            return [future.result() for future in futures]
+
+    def close(self):
+        """Stop the idle workers"""
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            worker.stop()
+
+
+def start():
+    """Start the pool of this process, if not started yet"""
+    get_pool()
+
+
+def get_pool():
+    """Return the pool of this process"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = Pool()
+    return _pool
+
+
+def stop():
+    """Stop the pool of this process"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+
+def _reset_pool():
+    # The pipes of the workers belong to the parent process
+    global _pool, _pool_lock
+    _pool = None
+    _pool_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_pool)
@@ -2,10 +2,11 @@
 import logging
 import os
 import sys
+import time
 
-from flask import Flask, redirect, request
+from flask import Flask, Response, g, redirect, request
 from pep8speaks.constants import LOG_LEVEL
-from pep8speaks import handlers, utils
+from pep8speaks import handlers, jobs, metrics, utils
 
 
 def create_app():
@@ -36,7 +37,13 @@ def create_app():
                     "installation": handlers.handle_installation,
                 }
                 supported_event = event in event_to_action
-                if supported_event:
+                # Label of the request in the metrics
+                g.event = event if supported_event else "unsupported"
+                if supported_event and event in jobs.ASYNC_EVENTS:
+                    # Respond before GitHub's timeout, the event is handled in the background
+                    job = jobs.enqueue(request)
+                    return utils.Response({"message": "Accepted", "job": job.id}, status=202)
+                elif supported_event:
                     return event_to_action[event](request)
                 else:
                     return handlers.handle_unsupported_requests(request)
@@ -46,6 +53,26 @@ def create_app():
         else:
             return redirect("https://pep8speaks.org")
 
+    @app.route("/metrics")
+    def metrics_endpoint():
+        """Metrics of all the workers, in the Prometheus text format"""
+        return Response(metrics.render(metrics.collect()), mimetype="text/plain; version=0.0.4")
+
+    @app.before_request
+    def start_timer():
+        g.started_at = time.monotonic()
+
+    @app.after_request
+    def record_request(response):
+        if request.endpoint == "main" and request.method == "POST":
+            event = g.get("event", "unauthorized")
+            metrics.inc("webhook_requests_total", event=event, status=str(response.status_code))
+            metrics.observe("webhook_request_seconds", time.monotonic() - g.started_at, event=event)
+        return response
+
+    # Start the workers, which also resume the jobs left in a durable queue
+    jobs.get_queue()
+
     app.secret_key = os.environ.setdefault("APP_SECRET_KEY", "")
     app.config['SESSION_TYPE'] = 'filesystem'
 
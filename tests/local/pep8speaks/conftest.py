@@ -0,0 +1,11 @@
+import pytest
+import yaml
+
+
+@pytest.fixture
+def config():
+    with open("data/default_pep8speaks.yml") as config_file:
+        config = yaml.safe_load(config_file)
+    config["pycodestyle_cmd_config"] = " "
+    config["flake8_cmd_config"] = " "
+    return config
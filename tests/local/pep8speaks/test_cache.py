@@ -0,0 +1,76 @@
+import time
+
+from pep8speaks import cache
+
+
+class TestCache:
+    def test_lru(self):
+        lru = cache.LRUCache(maxsize=2)
+        lru.set("k1", 1)
+        lru.set("k2", None)
+        assert lru.get("k1") == 1  # k2 is now the least recently used
+        lru.set("k3", 3)
+        assert lru.get("k2") is cache.MISSING
+        assert lru.get("k1") == 1
+        assert lru.get("k3") == 3
+
+    def test_ttl(self, mocker):
+        lru = cache.LRUCache(maxsize=2)
+        lru.set("k1", 1, ttl=10)
+        assert lru.get("k1") == 1
+        mocker.patch("time.time", return_value=time.time() + 20)
+        assert lru.get("k1") is cache.MISSING
+        assert len(lru) == 0
+
+    def test_disk(self, tmp_path):
+        disk = cache.DiskCache(str(tmp_path), max_bytes=1000)
+        disk.set(("o/r", "sha", "a.py"), "x" * 400)
+        assert disk.get(("o/r", "sha", "a.py")) == "x" * 400
+        assert disk.get(("o/r", "sha", "b.py")) is cache.MISSING
+        disk.set(("o/r", "sha", "b.py"), "y" * 400)
+        disk.set(("o/r", "sha", "c.py"), "z" * 400)
+        # The oldest entry is evicted
+        assert disk.get(("o/r", "sha", "a.py")) is cache.MISSING
+        assert disk.get(("o/r", "sha", "c.py")) == "z" * 400
+
+    def test_disk_overwrite(self, tmp_path):
+        disk = cache.DiskCache(str(tmp_path), max_bytes=1000)
+        disk.set("k1", "x" * 400)
+        size = disk._size
+        disk.set("k1", "x" * 400)
+        assert disk._size == size
+        assert disk._size == disk._scan_size()
+
+    def test_tiers(self, tmp_path):
+        files = cache.Cache("files", maxsize=10, directory=str(tmp_path), max_bytes=10000)
+        files.set("k1", "v1", ttl=60)
+        assert files.get("k1") == "v1"
+        assert files.get("k2") is cache.MISSING
+        assert (files.hits, files.misses) == (1, 1)
+
+        # Another process only sees the disk
+        other = cache.Cache("files", maxsize=10, directory=str(tmp_path), max_bytes=10000)
+        assert other.get("k1") == "v1"
+        assert other.memory.get("k1") == "v1"
+
+    def test_lru_max_bytes(self):
+        lru = cache.LRUCache(maxsize=10, max_bytes=10)
+        lru.set("k1", "x" * 4)
+        lru.set("k2", "y" * 4)
+        lru.set("k1", "x" * 5)
+        assert lru.bytes == 9
+        lru.set("k3", "z" * 4)
+        # k2 is the least recently used
+        assert lru.get("k2") is cache.MISSING
+        assert lru.get("k1") == "x" * 5
+        assert lru.bytes == 9
+        lru.set("k4", "w" * 20)
+        assert len(lru) == 0
+        assert lru.bytes == 0
+
+    def test_memory_bytes(self):
+        files = cache.Cache("files", maxsize=10, memory_bytes=10, size_of=lambda value: len(value[1]))
+        files.set("k1", (200, "x" * 6))
+        files.set("k2", (200, "y" * 6))
+        assert files.get("k1") is cache.MISSING
+        assert files.get("k2") == (200, "y" * 6)
@@ -0,0 +1,161 @@
+from concurrent.futures import ThreadPoolExecutor
+import time
+
+import mock
+import pytest
+import requests
+from pep8speaks import client
+
+
+def make_response(status_code, content=b"", headers=None):
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = content
+    response.headers.update(headers or {})
+    response.encoding = "utf-8"
+    response.url = "https://api.github.com/repos/o/r"
+    return response
+
+
+@pytest.fixture
+def session(mocker):
+    client._conditional_cache.clear()
+    session = mock.MagicMock()
+    mocker.patch('pep8speaks.client.get_session', return_value=session)
+    return session
+
+
+class TestClient:
+    def test_connection_stats(self):
+        session = client.get_session()
+        adapter = session.get_adapter("https://api.github.com")
+        pool = adapter.poolmanager.connection_from_url("https://api.github.com")
+        pool.num_requests, pool.num_connections = 5, 1
+        assert client.connection_stats()["api.github.com"] == {"requests": 5, "connections": 1, "reused": 4}
+
+    def test_conditional_request(self, session):
+        url = "https://api.github.com/repos/o/r"
+        session.request.return_value = make_response(200, b'{"id": 1}', {"ETag": '"abc"'})
+        assert client.request("GET", url, headers={"Authorization": "Bearer t"}).json() == {"id": 1}
+        assert "If-None-Match" not in session.request.call_args[1]["headers"]
+
+        session.request.return_value = make_response(304, headers={"X-RateLimit-Remaining": "4999"})
+        response = client.request("GET", url, headers={"Authorization": "Bearer t"})
+        assert session.request.call_args[1]["headers"]["If-None-Match"] == '"abc"'
+        assert response.status_code == 200
+        assert response.json() == {"id": 1}
+        assert response.headers["X-RateLimit-Remaining"] == "4999"
+
+        # Another token or format is another entry
+        client.request("GET", url, headers={"Authorization": "Bearer u"})
+        assert "If-None-Match" not in session.request.call_args[1]["headers"]
+        client.request("GET", url, headers={"Authorization": "Bearer t", "Accept": "application/vnd.github.diff"})
+        assert "If-None-Match" not in session.request.call_args[1]["headers"]
+
+    def test_unconditional_request(self, session):
+        session.request.return_value = make_response(200, b"x", {"ETag": '"abc"'})
+        for _ in range(2):
+            client.request("POST", "https://api.github.com/gists", headers={})
+            client.request("GET", "https://raw.githubusercontent.com/o/r/sha/a.py", headers={})
+        assert len(client._conditional_cache) == 0
+
+    def test_rate_limit(self, mocker):
+        mocker.patch("pep8speaks.client.RATE_LIMIT_RESERVE", 10)
+        rate_limit = client.RateLimit()
+        assert rate_limit.acquire() == 0
+
+        now = time.time()
+        reset = now + 100
+        rate_limit.update(make_response(200, headers={"X-RateLimit-Remaining": "50", "X-RateLimit-Reset": str(reset)}))
+        assert rate_limit.acquire(client.LOW) < 1
+        assert rate_limit.remaining == 49
+
+        rate_limit.update(make_response(200, headers={"X-RateLimit-Remaining": "5", "X-RateLimit-Reset": str(reset)}))
+        assert rate_limit.acquire(client.HIGH) < 1
+        assert rate_limit.acquire(client.NORMAL) < 1
+        # The next slots are spread until the reset
+        assert 20 < rate_limit.next_slot - now < 30
+        assert 20 < rate_limit._delay(client.NORMAL, now) < 30
+        assert rate_limit._delay(client.HIGH, now) == 0
+        assert rate_limit.acquire(client.LOW) is None
+
+        rate_limit.update(make_response(200, headers={"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": str(reset)}))
+        assert 99 < rate_limit._delay(client.HIGH, now) <= 100
+
+        # Forgotten after the reset
+        rate_limit.reset = time.time() - 1
+        rate_limit.next_slot = 0
+        assert rate_limit.acquire(client.LOW) == 0
+
+    def test_rate_limit_slots(self, mocker):
+        mocker.patch("pep8speaks.client.RATE_LIMIT_RESERVE", 10)
+        rate_limit = client.RateLimit()
+        reset = time.time() + 0.8
+        rate_limit.update(make_response(200, headers={"X-RateLimit-Remaining": "4", "X-RateLimit-Reset": str(reset)}))
+
+        # Concurrent requests get their own slot, 0.2 seconds apart
+        with ThreadPoolExecutor(3) as executor:
+            waited = sorted(executor.map(lambda _: rate_limit.acquire(), range(3)))
+        assert waited[0] < 0.1
+        assert 0.1 < waited[1] < waited[2] - 0.1
+        assert rate_limit.remaining == 1
+
+    def test_rate_limit_priority(self):
+        rate_limit = client.RateLimit()
+        reset = time.time() + 60
+        rate_limit.update(make_response(200, headers={"X-RateLimit-Remaining": "1", "X-RateLimit-Reset": str(reset)}))
+        rate_limit.block(0.3)
+
+        with ThreadPoolExecutor(2) as executor:
+            normal = executor.submit(rate_limit.acquire, client.NORMAL, timeout=1)
+            time.sleep(0.1)
+            high = executor.submit(rate_limit.acquire, client.HIGH, timeout=1)
+            # The last request left goes to the high priority one, ahead of the waiting one
+            assert 0.1 < high.result() < 0.5
+            assert normal.result() >= 1
+
+    def test_rate_limit_timeout(self):
+        rate_limit = client.RateLimit()
+        rate_limit.block(60)
+        assert 0.1 <= rate_limit.acquire(client.HIGH, timeout=0.1) < 1
+
+    def test_request_dropped(self, session, mocker):
+        rate_limit = client.RateLimit()
+        mocker.patch("pep8speaks.client.get_rate_limit", return_value=rate_limit)
+        rate_limit.block(60)
+        response = client.request("PUT", "https://api.github.com/user/starred/o/r", headers={}, priority=client.LOW)
+        assert response.status_code == 429
+        assert not session.request.called
+
+    @pytest.mark.parametrize('response', [
+        make_response(403, b'{"message": "You have exceeded a secondary rate limit"}'),
+        make_response(429, headers={"Retry-After": "2"}),
+        make_response(403, headers={"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": "0"}),
+    ])
+    def test_request_retried(self, session, mocker, response):
+        rate_limit = client.RateLimit()
+        block = mocker.patch.object(rate_limit, "block")
+        mocker.patch("pep8speaks.client.get_rate_limit", return_value=rate_limit)
+        session.request.side_effect = [response, make_response(201)]
+        assert client.request("POST", "https://api.github.com/gists", headers={}).status_code == 201
+        assert session.request.call_count == 2
+        assert block.called
+
+    def test_request_forbidden(self, session, mocker):
+        mocker.patch("pep8speaks.client.get_rate_limit", return_value=client.RateLimit())
+        session.request.return_value = make_response(403, b'{"message": "Resource not accessible"}')
+        assert client.request("POST", "https://api.github.com/gists", headers={}).status_code == 403
+        assert session.request.call_count == 1
+
+    @pytest.mark.parametrize('url, expected', [
+        ("https://api.github.com/repos/o/r/pulls/12/files", "/repos/{owner}/{repo}/pulls/{number}/files"),
+        ("https://api.github.com/repos/o/r/contents/a/b.py?ref=main", "/repos/{owner}/{repo}/contents/{path}"),
+        ("https://api.github.com/repos/o/r/git/refs/heads/a/b", "/repos/{owner}/{repo}/git/refs/heads/{path}"),
+        ("https://api.github.com/repos/o/r/compare/1...2", "/repos/{owner}/{repo}/compare/{range}"),
+        (f"https://api.github.com/repos/o/r/git/trees/{'a' * 40}", "/repos/{owner}/{repo}/git/trees/{sha}"),
+        ("https://api.github.com/user/starred/o/r", "/user/starred/{owner}/{repo}"),
+        ("https://api.github.com/users/someone/followers", "/users/{user}/followers"),
+        ("https://api.github.com/gists", "/gists"),
+    ])
+    def test_endpoint(self, url, expected):
+        assert client.endpoint(url) == expected
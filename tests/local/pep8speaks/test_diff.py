@@ -0,0 +1,135 @@
+import mock
+import pytest
+from pep8speaks import diff
+
+DIFF = b"""diff --git a/a.py b/a.py
+new file mode 100644
+index 0000000..1111111
+--- /dev/null
++++ b/a.py
+@@ -0,0 +1,2 @@
++import os,sys
++x=1
+diff --git a/pkg/b.py b/pkg/b.py
+index 0000000..1111111 100644
+--- a/pkg/b.py
++++ b/pkg/b.py
+@@ -1,2 +1,4 @@
+-def f(a):
++def f( a ):
+     return a
++
++y = 2
+diff --git a/README.md b/README.md
+index 0000000..1111111 100644
+--- a/README.md
++++ b/README.md
+@@ -1 +1 @@
+-x
++y
+"""
+
+
+class TestDiff:
+    def test_parse_diff(self):
+        files = diff.parse_diff(DIFF.splitlines(), encoding="utf-8")
+        files = {diff_file: list(lines) for diff_file, lines in files.items()}
+        assert files == {"/a.py": [1, 2], "/pkg/b.py": [1, 3, 4], "/README.md": [1]}
+
+    def test_added_lines(self):
+        lines = diff.AddedLines([3, 4, 5, 9, 11, 12])
+        assert repr(lines) == "AddedLines(3-5, 9-9, 11-12)"
+        assert list(lines) == [3, 4, 5, 9, 11, 12]
+        assert len(lines) == 6
+        for line in range(15):
+            assert (line in lines) == (line in [3, 4, 5, 9, 11, 12])
+        assert not diff.AddedLines()
+        with pytest.raises(ValueError):
+            lines.add(10)
+
+    def test_pull_request_diff(self, mocker):
+        response = mock.MagicMock(status_code=200, encoding="utf-8")
+        response.iter_content.return_value = [DIFF[:100], DIFF[100:]]
+        query_request = mocker.patch("pep8speaks.utils.query_request", return_value=response)
+        pr_diff = diff.PullRequestDiff("o/r", 1)
+        assert query_request.call_count == 0
+
+        assert list(pr_diff.py_files()) == ["/a.py", "/pkg/b.py"]
+        assert list(pr_diff.py_files(["pkg/"])) == ["/a.py"]
+        assert len(pr_diff.files) == 3
+        assert query_request.call_count == 1
+        assert query_request.call_args[0][0] == "/repos/o/r/pulls/1"
+
+    def test_list_files(self, mocker):
+        first = mock.MagicMock(status_code=200, links={"next": {"url": "https://api.github.com/page2"}})
+        first.json.return_value = [{"filename": "a.py", "status": "added", "sha": "1" * 40}]
+        second = mock.MagicMock(status_code=200, links={})
+        second.json.return_value = [{"filename": "b.py", "status": "removed", "sha": "2" * 40}]
+        query_request = mocker.patch("pep8speaks.utils.query_request", side_effect=[first, second])
+
+        files = diff.list_files("o/r", 1)
+        assert next(files)["filename"] == "a.py"
+        assert query_request.call_count == 1
+        assert next(files)["filename"] == "b.py"
+        assert query_request.call_args_list[1][0][0] == "https://api.github.com/page2"
+
+    def test_blob_shas(self, mocker):
+        mocker.patch("pep8speaks.diff.list_files", return_value=[
+            {"filename": "a.py", "status": "modified", "sha": "1" * 40},
+            {"filename": "b.py", "status": "removed", "sha": "2" * 40},
+        ])
+        assert diff.PullRequestDiff("o/r", 1).blob_shas == {"/a.py": "1" * 40}
+
+    @pytest.mark.parametrize('status_code, max_diff_size', [(200, 100), (406, 0)])
+    def test_pull_request_diff_too_large(self, mocker, status_code, max_diff_size):
+        mocker.patch("pep8speaks.diff.MAX_DIFF_SIZE", max_diff_size)
+        response = mock.MagicMock(status_code=status_code, encoding="utf-8")
+        response.iter_content.return_value = [DIFF[:100], DIFF[100:]]
+        mocker.patch("pep8speaks.utils.query_request", return_value=response)
+        mocker.patch("pep8speaks.diff.list_files", return_value=[
+            {"filename": "a.py", "status": "added", "patch": "@@ -0,0 +1,2 @@\n+import os,sys\n+x=1"},
+            {"filename": "big.py", "status": "modified"},
+            {"filename": "c.py", "status": "removed", "patch": "@@ -1 +0,0 @@\n-x = 1"},
+        ])
+        pr_diff = diff.PullRequestDiff("o/r", 1)
+        assert list(pr_diff.files["/a.py"]) == [1, 2]
+        assert not pr_diff.files["/big.py"]
+        assert "/c.py" not in pr_diff.files
+        assert pr_diff.degraded
+
+    def test_parse_diff_content_like_headers(self):
+        lines = [
+            b"diff --git a/x.py b/x.py",
+            b"--- a/x.py",
+            b"+++ b/x.py",
+            b"@@ -1,3 +1,4 @@",
+            b" a",
+            b"-+++ b/old.py",
+            b"++++ b/new.py",
+            b"+diff --git a/q b/q",
+            b" c\r",
+            b"\\ No newline at end of file",
+            b'diff --git "a/caf\\303\\251.py" "b/caf\\303\\251.py"',
+            b'--- "a/caf\\303\\251.py"',
+            b'+++ "b/caf\\303\\251.py"',
+            b"@@ -1 +1 @@",
+            b"-x",
+            b"+y",
+            b"diff --git a/gone.py b/gone.py",
+            b"deleted file mode 100644",
+            b"--- a/gone.py",
+            b"+++ /dev/null",
+            b"@@ -1 +0,0 @@",
+            b"-x",
+        ]
+        files = diff.parse_diff(lines)
+        assert {path: list(added) for path, added in files.items()} == {"/x.py": [2, 3], "/café.py": [1]}
+
+    def test_pull_request_diff_streamed(self, mocker):
+        response = mock.MagicMock(status_code=200, encoding="utf-8")
+        # Chunks ending in the middle of lines
+        response.iter_content.return_value = [DIFF[i:i + 7] for i in range(0, len(DIFF), 7)]
+        mocker.patch("pep8speaks.utils.query_request", return_value=response)
+        files = diff.PullRequestDiff("o/r", 1).files
+        assert files == diff.parse_diff(DIFF.splitlines())
+        assert response.close.called
@@ -0,0 +1,54 @@
+import mock
+import pytest
+from pep8speaks import forks
+
+
+def response(status_code, data=None, next_url=None):
+    links = {"next": {"url": next_url}} if next_url else {}
+    return mock.MagicMock(status_code=status_code, json=mock.MagicMock(return_value=data), links=links)
+
+
+class TestForks:
+    def test_list_forks(self, mocker):
+        pages = [
+            response(200, [
+                {"full_name": "bot/a", "fork": True, "description": forks.describe("o/a")},
+                {"full_name": "bot/b", "fork": False, "description": forks.describe("o/b")},
+            ], next_url="https://api.github.com/user/repos?page=2"),
+            response(200, [
+                {"full_name": "bot/c", "fork": True, "description": None},
+                {"full_name": "bot/d.py", "fork": True, "description": forks.describe("some-one/d.py")},
+            ]),
+        ]
+        query_request = mocker.patch("pep8speaks.utils.query_request", side_effect=pages)
+        assert list(forks.list_forks()) == [("o/a", "bot/a"), ("some-one/d.py", "bot/d.py")]
+        assert query_request.call_args[0][0] == "https://api.github.com/user/repos?page=2"
+
+    def test_registry(self, mocker):
+        list_forks = mocker.patch("pep8speaks.forks.list_forks", return_value=[("o/a", "bot/a")])
+        monotonic = mocker.patch("pep8speaks.forks.time.monotonic", return_value=1000)
+        registry = forks.ForkRegistry(ttl=600)
+        assert registry.get("o/a") == "bot/a"
+        registry.add("o/b", "bot/b")
+        assert registry.get("o/b") == "bot/b"
+        registry.remove("o/a")
+        assert registry.get("o/a") is None
+        assert list_forks.call_count == 1
+
+        monotonic.return_value = 1601
+        assert registry.get("o/a") == "bot/a"
+        assert list_forks.call_count == 2
+
+    @pytest.mark.parametrize('statuses, ready, sleeps', [
+        ([200], True, []),
+        ([404, 404, 404, 200], True, [1, 2, 4]),
+        ([404] * 10, False, [1, 2, 4, 3]),
+    ])
+    def test_wait_until_ready(self, mocker, statuses, ready, sleeps):
+        mocker.patch("pep8speaks.utils.query_request", side_effect=[response(status) for status in statuses])
+        clock = [0]
+        sleep = mocker.patch(
+            "pep8speaks.forks.time.sleep", side_effect=lambda seconds: clock.append(clock[-1] + seconds))
+        mocker.patch("pep8speaks.forks.time.monotonic", side_effect=lambda: clock[-1])
+        assert forks.wait_until_ready("bot/a", timeout=10) is ready
+        assert [call[0][0] for call in sleep.call_args_list] == sleeps
@@ -1 +1,326 @@
-# TODO
+import mock
+import pytest
+from pep8speaks import diff, helpers, models
+
+SOURCE = "import os,sys\n"
+
+
+class TestHelpers:
+    def test_git_blob_sha(self):
+        assert helpers.git_blob_sha("hello\n") == "ce013625030ba8dba906f756967f9e9ca394464a"
+
+    def test_lint_files_cache(self, mocker, config):
+        mocker.patch("pep8speaks.helpers.LINT_WORKERS", 0)
+        mocker.patch.object(helpers, "_lint_cache", helpers.cache.Cache("lint", 16))
+        fetch_file = mocker.patch(
+            "pep8speaks.helpers.fetch_file", return_value=models.RawFile(200, SOURCE, "utf-8"))
+        lint = mocker.spy(helpers.linters, "lint")
+
+        first = helpers.lint_files("o/r", "a" * 40, ["/a.py", "/b.py"], config, {"/a.py": "1" * 40})
+        assert [issue.code for issue in first["/a.py"][0]] == ["E231", "E401"]
+        assert lint.call_count == 2
+
+        # /a.py is known by its blob SHA, /b.py by the SHA of its content
+        second = helpers.lint_files("o/r", "b" * 40, ["/a.py", "/b.py"], config, {"/a.py": "1" * 40})
+        assert second == first
+        assert lint.call_count == 2
+        assert fetch_file.call_count == 3
+
+        # Another configuration is another result
+        config["pycodestyle"]["ignore"] = ["E231"]
+        config["pycodestyle_cmd_config"] = " --ignore=E231"
+        third = helpers.lint_files("o/r", "b" * 40, ["/a.py"], config, {"/a.py": "1" * 40})
+        assert [issue.code for issue in third["/a.py"][0]] == ["E401"]
+
+    @pytest.mark.parametrize('status, files, expected', [
+        ("ahead", [{"filename": "a.py"}, {"filename": "b.py", "previous_filename": "c.py"}],
+         {"/a.py", "/b.py", "/c.py"}),
+        ("identical", [], set()),
+        ("diverged", [{"filename": "a.py"}], None),
+        ("ahead", [{"filename": f"{i}.py"} for i in range(300)], None),
+    ])
+    def test_changed_files(self, mocker, status, files, expected):
+        response = mock.MagicMock(status_code=200)
+        response.json.return_value = {"status": status, "files": files}
+        query_request = mocker.patch("pep8speaks.utils.query_request", return_value=response)
+        assert helpers.changed_files("o/r", "1" * 40, "2" * 40) == expected
+        assert query_request.call_args[0][0] == f"/repos/o/r/compare/{'1' * 40}...{'2' * 40}"
+
+    def test_run_pycodestyle_incremental(self, mocker, config):
+        mocker.patch.object(helpers, "_pr_state", helpers.cache.Cache("pull_requests", 16))
+        issue = models.LintIssue("a.py", 1, 1, "E401", "multiple imports on one line")
+        lint_files = mocker.patch(
+            "pep8speaks.helpers.lint_files",
+            side_effect=lambda repo, ref, paths, *args: {path: ([issue], []) for path in paths})
+        changed_files = mocker.patch("pep8speaks.helpers.changed_files", return_value={"/b.py"})
+
+        ghrequest = mock.MagicMock(repository="o/r", pr_number=1, after_commit_hash="1" * 40, action="opened")
+        ghrequest.pr_diff.py_files.return_value = {"/a.py": diff.AddedLines([1]), "/b.py": diff.AddedLines([1])}
+        ghrequest.results = {}
+        helpers.run_pycodestyle(ghrequest, config)
+        assert lint_files.call_args[0][2] == ["/a.py", "/b.py"]
+
+        ghrequest.action = "synchronize"
+        ghrequest.after_commit_hash = "2" * 40
+        helpers.run_pycodestyle(ghrequest, config)
+        changed_files.assert_called_once_with("o/r", "1" * 40, "2" * 40)
+        assert lint_files.call_args[0][2] == ["/b.py"]
+        assert ghrequest.results == {"a.py": [issue], "b.py": [issue]}
+
+        # Force push
+        changed_files.return_value = None
+        ghrequest.after_commit_hash = "3" * 40
+        helpers.run_pycodestyle(ghrequest, config)
+        assert lint_files.call_args[0][2] == ["/a.py", "/b.py"]
+
+    def test_get_config(self, mocker):
+        files = {
+            "setup.cfg": "[flake8]\nmax-line-length = 100\nignore = E501,\n    w503\n",
+            ".pep8speaks.yml": "scanner:\n    linter: flake8\n",
+        }
+        mocker.patch("pep8speaks.helpers.list_root_files", return_value=set(files))
+        mocker.patch(
+            "pep8speaks.helpers.fetch_file",
+            side_effect=lambda repo, ref, path: models.RawFile(200, files[path], "utf-8"))
+        mocker.patch.object(helpers, "_config_cache", helpers.cache.LRUCache(16))
+        resolve_config = mocker.spy(helpers, "resolve_config")
+
+        config = helpers.get_config("o/r", "main", "a" * 40)
+        assert config["scanner"]["linter"] == "flake8"
+        assert config["flake8"]["ignore"] == ["E501", "W503"]
+        assert config["flake8_cmd_config"] == " --max-line-length=100 --ignore=E501,w503"
+
+        # Changes of the returned config do not change the next ones
+        config["message"]["opened"]["header"] = "Hello @me"
+        config = helpers.get_config("o/r", "main", "a" * 40)
+        assert config["message"]["opened"]["header"] == ""
+        assert helpers.resolve_config(*resolve_config.call_args[0]) is resolve_config.spy_return
+
+    def test_get_config_unsafe_yaml(self, mocker):
+        files = {".pep8speaks.yml": "scanner: !!python/object/apply:os.system ['echo']\n"}
+        mocker.patch("pep8speaks.helpers.list_root_files", return_value=set(files))
+        mocker.patch(
+            "pep8speaks.helpers.fetch_file",
+            side_effect=lambda repo, ref, path: models.RawFile(200, files[path], "utf-8"))
+        config = helpers.get_config("o/r", "main", "a" * 40)
+        assert config["scanner"] == helpers.DEFAULT_CONFIG["scanner"]
+
+    @pytest.mark.parametrize('filename, text', [
+        ("setup.cfg", "[flake8]\nmax-line-length = 100\nignore = E501, W503  # Comment\n"),
+        ("tox.ini", "[pycodestyle]\nmax-line-length = 100\nignore =\n    E501,\n    W503\n"),
+        (".flake8", "[flake8]\nmax-line-length = 100\nignore = E501,W503\n"),
+        ("pyproject.toml", "[tool.flake8]\nmax-line-length = 100\nignore = ['E501', 'W503']\n"),
+        ("pyproject.toml", "[tool.pycodestyle]\nmax-line-length = '100'\nignore = 'E501,W503'\n"),
+    ])
+    def test_read_linter_config_file(self, filename, text):
+        config = helpers.read_linter_config_file(filename, text)
+        assert config == {"max-line-length": 100, "ignore": ["E501", "W503"]}
+
+    @pytest.mark.parametrize('filename, text', [
+        ("setup.cfg", "[flake8]\nmax-line-length = long\nignore = E501\n"),
+        ("pyproject.toml", "[tool.flake8]\nmax-line-length = 'long'\nignore = ['E501']\n"),
+        ("pyproject.toml", "[tool.flake8]\nmax-line-length = [100]\nignore = ['E501']\n"),
+    ])
+    def test_read_linter_config_file_invalid(self, filename, text):
+        # The default max-line-length is used
+        assert helpers.read_linter_config_file(filename, text) == {"ignore": ["E501"]}
+
+    def test_get_config_discovery(self, mocker):
+        listings = {"main": {"setup.cfg", "README.md"}, "a" * 40: {"setup.cfg", "pyproject.toml", ".pep8speaks.yml"}}
+        files = {
+            ("main", "setup.cfg"): "[metadata]\nname = r\n",
+            ("a" * 40, "pyproject.toml"): "[tool.flake8]\nmax-line-length = 100\n",
+            ("a" * 40, ".pep8speaks.yml"): "scanner:\n    linter: flake8\n",
+        }
+        mocker.patch("pep8speaks.helpers.list_root_files", side_effect=lambda repo, ref: listings[ref])
+        fetch_file = mocker.patch(
+            "pep8speaks.helpers.fetch_file",
+            side_effect=lambda repo, ref, path: models.RawFile(200, files[ref, path], "utf-8"))
+
+        config = helpers.get_config("o/r", "main", "a" * 40)
+        assert config["scanner"]["linter"] == "flake8"
+        assert config["flake8"]["max-line-length"] == 100
+        # setup.cfg of the base branch wins, but has no linter section
+        assert sorted(call[0][1:] for call in fetch_file.call_args_list) == [
+            ("a" * 40, ".pep8speaks.yml"), ("a" * 40, "pyproject.toml"), ("main", "setup.cfg")]
+
+    @pytest.mark.parametrize('files, exclude, expected, diff_used', [
+        ([{"filename": "a.md", "status": "added"}, {"filename": "b.py", "status": "added"}], None, True, False),
+        ([{"filename": "a.md", "status": "added"}, {"filename": "b.py", "status": "removed"}], None, False, False),
+        ([{"filename": "docs/b.py", "status": "added"}], ["docs/"], False, False),
+        ([], None, True, True),
+    ])
+    def test_check_pythonic_pr(self, mocker, files, exclude, expected, diff_used):
+        mocker.patch("pep8speaks.diff.list_files", return_value=iter(files))
+        ghrequest = mock.MagicMock(repository="o/r", pr_number=1)
+        ghrequest.pr_diff.py_files.return_value = {"/a.py": diff.AddedLines([1])}
+        assert helpers.check_pythonic_pr(ghrequest, exclude) == expected
+        assert ghrequest.pr_diff.py_files.called == diff_used
+
+    def test_commit(self, mocker):
+        responses = {
+            ("GET", "/repos/bot/r/git/ref/heads/main-pep8-patch"): (200, {"object": {"sha": "c1"}}),
+            ("GET", "/repos/bot/r/git/commits/c1"): (200, {"tree": {"sha": "t1"}}),
+            ("GET", "/repos/bot/r/git/trees/t1"): (200, {"tree": [
+                {"path": "a.py", "mode": "100755", "sha": "1" * 40},
+                {"path": "b.py", "mode": "100644", "sha": helpers.git_blob_sha("x = 1\n")},
+                {"path": "c", "mode": "040000", "sha": "2" * 40},
+            ]}),
+            # Too large, the modes of the files in c are not known
+            ("GET", "/repos/bot/r/git/trees/c1:c"): (200, {"truncated": True, "tree": [
+                {"path": "d.py", "mode": "100755", "sha": "3" * 40},
+            ]}),
+            ("POST", "/repos/bot/r/git/blobs"): (201, {"sha": "b1"}),
+            ("POST", "/repos/bot/r/git/trees"): (201, {"sha": "t2"}),
+            ("POST", "/repos/bot/r/git/commits"): (201, {"sha": "c2"}),
+            ("PATCH", "/repos/bot/r/git/refs/heads/main-pep8-patch"): (200, {}),
+        }
+
+        def query_request(query, method="GET", **kwargs):
+            status_code, data = responses[method, query]
+            return mock.MagicMock(status_code=status_code, json=mock.MagicMock(return_value=data))
+
+        query = mocker.patch("pep8speaks.utils.query_request", side_effect=query_request)
+        ghrequest = mock.MagicMock(fork_fullname="bot/r", new_branch="main-pep8-patch", error=None)
+        ghrequest.results = {"a.py": "import os\nimport sys\n", "b.py": "x = 1\n", "c/d.py": "y = 2\n"}
+        helpers.commit(ghrequest)
+
+        assert ghrequest.error is None
+        calls = {(call[1].get("method", "GET"), call[0][0]): call[1].get("json") for call in query.call_args_list}
+        # b.py is not changed by the fixes
+        blobs = [call[1]["json"]["content"] for call in query.call_args_list if call[0][0].endswith("/blobs")]
+        assert sorted(blobs) == ["import os\nimport sys\n", "y = 2\n"]
+        assert calls["POST", "/repos/bot/r/git/trees"] == {"base_tree": "t1", "tree": [
+            {"path": "a.py", "mode": "100755", "type": "blob", "sha": "b1"},
+            {"path": "c/d.py", "mode": "100644", "type": "blob", "sha": "b1"},
+        ]}
+        assert calls["POST", "/repos/bot/r/git/commits"]["parents"] == ["c1"]
+        # Only the directories of the files are listed
+        assert [call for call in query.call_args_list if "/trees/" in call[0][0] and call[1].get("params")] == []
+        assert calls["PATCH", "/repos/bot/r/git/refs/heads/main-pep8-patch"] == {"sha": "c2", "force": False}
+
+    def test_tree_entries(self, mocker):
+        trees = {
+            "/repos/o/r/git/trees/t1": [{"path": "setup.py", "mode": "100755"}],
+            "/repos/o/r/git/trees/c1:pkg/sub": [{"path": "m.py", "mode": "100644"}, {"path": "n.py", "mode": "100644"}],
+        }
+        mocker.patch("pep8speaks.utils.query_request", side_effect=lambda query: mock.MagicMock(
+            status_code=200, json=mock.MagicMock(return_value={"tree": trees[query]})))
+        entries = helpers.tree_entries("o/r", "c1", "t1", ["setup.py", "pkg/sub/m.py"])
+        assert entries["setup.py"]["mode"] == "100755"
+        assert entries["pkg/sub/m.py"] == {"path": "pkg/sub/m.py", "mode": "100644"}
+
+    @pytest.mark.parametrize('registered, fork_status, forked', [
+        ("bot/r", 200, False),
+        ("bot/r", 404, True),
+        (None, None, True),
+    ])
+    def test_fork_for_pr(self, mocker, registered, fork_status, forked):
+        registry = helpers.forks.ForkRegistry()
+        mocker.patch.object(helpers.forks, "registry", registry)
+        mocker.patch.object(registry, "_load")
+        if registered:
+            registry.add("o/r", registered)
+        responses = {
+            ("GET", "/repos/bot/r"): mock.MagicMock(status_code=fork_status),
+            ("POST", "/repos/o/r/forks"): mock.MagicMock(
+                status_code=202, json=mock.MagicMock(return_value={"full_name": "bot/r-1"})),
+            ("PATCH", "/repos/bot/r-1"): mock.MagicMock(status_code=200),
+        }
+        query = mocker.patch(
+            "pep8speaks.utils.query_request",
+            side_effect=lambda query, method="GET", **kwargs: responses[method, query])
+        wait_until_ready = mocker.patch("pep8speaks.forks.wait_until_ready", return_value=True)
+
+        ghrequest = mock.MagicMock(target_repo_fullname="o/r", error=None)
+        assert helpers.fork_for_pr(ghrequest)
+        assert ghrequest.error is None
+        assert ghrequest.fork_fullname == ("bot/r-1" if forked else "bot/r")
+        assert wait_until_ready.called == forked
+        assert registry.get("o/r") == ghrequest.fork_fullname
+        if forked:
+            assert query.call_args[1]["data"] == '{"name": "r", "description": "Forked from @o\'s o/r"}'
+
+    def test_create_new_branch_existing(self, mocker):
+        query = mocker.patch("pep8speaks.utils.query_request", side_effect=[
+            mock.MagicMock(status_code=422), mock.MagicMock(status_code=200)])
+        ghrequest = mock.MagicMock(fork_fullname="bot/r", target_repo_branch="main", error=None)
+        ghrequest.pull_request = {"head": {"sha": "1" * 40}}
+        helpers.create_new_branch(ghrequest)
+        assert ghrequest.error is None
+        assert ghrequest.new_branch == "main-pep8-patch"
+        assert query.call_args == mock.call(
+            "/repos/bot/r/git/refs/heads/main-pep8-patch", method='PATCH', json={"sha": "1" * 40, "force": True})
+
+    def test_fix_files_cache(self, mocker, config):
+        mocker.patch("pep8speaks.helpers.LINT_WORKERS", 0)
+        mocker.patch.object(helpers, "_fix_cache", helpers.cache.Cache("fixes", 16))
+        fetch_file = mocker.patch(
+            "pep8speaks.helpers.fetch_file",
+            side_effect=lambda repo, ref, path: models.RawFile(200 if path != "/c.py" else 500, SOURCE, "utf-8"))
+        fix = mocker.spy(helpers.linters, "fix")
+
+        first = helpers.fix_files("o/r", "a" * 40, ["/a.py", "/b.py", "/c.py"], config)
+        assert first["/a.py"][0] == "import os\nimport sys\n"
+        assert fix.call_count == 2
+
+        # The file which could not be downloaded is downloaded again
+        second = helpers.fix_files("o/r", "a" * 40, ["/b.py", "/a.py", "/c.py"], config)
+        assert second == first
+        assert list(second) == ["/b.py", "/a.py"]
+        assert fix.call_count == 2
+        assert fetch_file.call_count == 4
+
+        # Other options or another commit are other fixes
+        config["pycodestyle"]["ignore"] = ["E401"]
+        helpers.fix_files("o/r", "a" * 40, ["/a.py"], config)
+        config["pycodestyle"]["ignore"] = []
+        helpers.fix_files("o/r", "b" * 40, ["/a.py"], config)
+        assert fix.call_count == 4
+
+    def test_fix_files_download_error(self, mocker, config):
+        mocker.patch("pep8speaks.helpers.LINT_WORKERS", 0)
+        mocker.patch.object(helpers, "_fix_cache", helpers.cache.Cache("fixes", 16))
+        mocker.patch("pep8speaks.helpers.fetch_files", return_value=[
+            models.RawFile(200, SOURCE, "utf-8"), models.RawFile(404, "404: Not Found", "utf-8")])
+        fix = mocker.spy(helpers.linters, "fix")
+        fixes = helpers.fix_files("o/r", "a" * 40, ["/a.py", "/b.py"], config)
+        assert list(fixes) == ["/a.py"]
+        assert fix.call_count == 1
+
+    def test_lint_files_download_error(self, mocker, config):
+        mocker.patch("pep8speaks.helpers.LINT_WORKERS", 0)
+        mocker.patch.object(helpers, "_lint_cache", helpers.cache.Cache("lint", 16))
+        fetch_file = mocker.patch(
+            "pep8speaks.helpers.fetch_file", return_value=models.RawFile(500, "<html>Error</html>", "utf-8"))
+
+        assert helpers.lint_files("o/r", "a" * 40, ["/a.py"], config, {"/a.py": "1" * 40}) == {}
+        fetch_file.return_value = models.RawFile(200, SOURCE, "utf-8")
+        results = helpers.lint_files("o/r", "a" * 40, ["/a.py"], config, {"/a.py": "1" * 40})
+        assert [issue.code for issue in results["/a.py"][0]] == ["E231", "E401"]
+        assert fetch_file.call_count == 2
+
+    def test_run_pycodestyle_download_error(self, mocker, config):
+        mocker.patch("pep8speaks.helpers.LINT_WORKERS", 0)
+        mocker.patch.object(helpers, "_lint_cache", helpers.cache.Cache("lint", 16))
+        mocker.patch.object(helpers, "_pr_state", helpers.cache.Cache("pull_requests", 16))
+        mocker.patch("pep8speaks.helpers.changed_files", return_value=set())
+        fetch_file = mocker.patch(
+            "pep8speaks.helpers.fetch_file",
+            side_effect=lambda repo, ref, path: models.RawFile(500 if path == "/b.py" else 200, SOURCE, "utf-8"))
+
+        ghrequest = mock.MagicMock(repository="o/r", pr_number=1, after_commit_hash="1" * 40, action="opened")
+        ghrequest.pr_diff.py_files.return_value = {"/a.py": diff.AddedLines([1]), "/b.py": diff.AddedLines([1])}
+        ghrequest.pr_diff.blob_shas = {}
+        ghrequest.results = {}
+        helpers.run_pycodestyle(ghrequest, config)
+        assert list(ghrequest.results) == ["a.py"]
+
+        # Nothing changed in /b.py, but it was not linted
+        fetch_file.side_effect = lambda repo, ref, path: models.RawFile(200, SOURCE, "utf-8")
+        ghrequest.action = "synchronize"
+        ghrequest.after_commit_hash = "2" * 40
+        ghrequest.results = {}
+        helpers.run_pycodestyle(ghrequest, config)
+        assert [call[0][2] for call in fetch_file.call_args_list[-1:]] == ["/b.py"]
+        assert sorted(ghrequest.results) == ["a.py", "b.py"]
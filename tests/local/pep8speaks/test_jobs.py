@@ -0,0 +1,138 @@
+import time
+
+import flask
+import mock
+import pytest
+from pep8speaks import coalesce, jobs, metrics
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def backend(request, tmp_path):
+    if request.param == "sqlite":
+        return jobs.SQLiteQueue(str(tmp_path / "jobs.sqlite3"))
+    return jobs.MemoryQueue()
+
+
+class TestJobs:
+    def test_queue(self, backend):
+        assert backend.get(timeout=0) is None
+        first = jobs.Job("pull_request", {"action": "opened"}, {"X-GitHub-Event": "pull_request"})
+        second = jobs.Job("issue_comment", {"action": "created"}, {"X-GitHub-Event": "issue_comment"})
+        backend.put(first)
+        backend.put(second)
+        assert len(backend) == 2
+
+        job = backend.get(timeout=0)
+        assert job.id == first.id
+        assert job.json == {"action": "opened"}
+        assert job.headers["X-GitHub-Event"] == "pull_request"
+        assert len(backend) == 1
+        backend.done(job)
+        assert backend.get(timeout=0).id == second.id
+
+    def test_sqlite_recover(self, tmp_path):
+        path = str(tmp_path / "jobs.sqlite3")
+        backend = jobs.SQLiteQueue(path)
+        backend.put(jobs.Job("pull_request", {}, {}))
+        job = backend.get(timeout=0)
+        assert len(backend) == 0
+
+        # A job left running by a live process is not queued again
+        assert len(jobs.SQLiteQueue(path)) == 0
+
+        with mock.patch("pep8speaks.jobs._process_exists", return_value=False):
+            backend = jobs.SQLiteQueue(path)
+        assert backend.get(timeout=0).id == job.id
+
+    def test_run(self, mocker):
+        handler = mock.MagicMock()
+        mocker.patch("pep8speaks.handlers.handle_pull_request", handler)
+        queue = jobs.JobQueue(jobs.MemoryQueue(), workers=0)
+        job = queue.submit(jobs.Job("pull_request", {"action": "opened"}, {}))
+        queue.run(queue.backend.get(timeout=0))
+        handler.assert_called_once_with(job)
+
+    def test_run_request(self, backend, mocker):
+        query_request = mocker.patch("pep8speaks.utils.query_request")
+        query_request.return_value.ok = False
+        metrics.reset()
+        payload = {"action": "opened", "repository": {"url": "https://api.github.com/repos/o/r"}}
+        app = flask.Flask(__name__)
+        with app.test_request_context(json=payload, headers={"X-GitHub-Event": "pull_request"}) as context:
+            job = jobs.Job.from_request(context.request)
+        queue = jobs.JobQueue(backend, workers=0)
+        queue.submit(job)
+
+        queue.run(queue.backend.get(timeout=0))
+        query_request.assert_called_once_with("https://api.github.com/repos/o/r")
+        counters = metrics.snapshot()["counters"]
+        assert counters["jobs_total", (("event", "pull_request"), ("outcome", "done"))] == 1
+
+    def test_run_failure(self, mocker):
+        mocker.patch("pep8speaks.handlers.handle_issue_comment", mock.MagicMock(side_effect=KeyError))
+        queue = jobs.JobQueue(jobs.MemoryQueue(), workers=0)
+        queue.submit(jobs.Job("issue_comment", {}, {}))
+        queue.run(queue.backend.get(timeout=0))
+        assert len(queue.backend) == 0
+
+    def test_not_before(self, backend):
+        later = jobs.Job("pull_request", {}, {}, not_before=time.time() + 60)
+        now = jobs.Job("pull_request", {}, {})
+        backend.put(later)
+        backend.put(now)
+        assert backend.get(timeout=0).id == now.id
+        assert backend.get(timeout=0) is None
+        assert len(backend) == 1
+
+    def test_coalesce(self, mocker):
+        handler = mock.MagicMock()
+        mocker.patch("pep8speaks.handlers.handle_pull_request", handler)
+        queue = jobs.JobQueue(jobs.MemoryQueue(), workers=0)
+        payloads = [
+            {"action": "synchronize", "repository": {"full_name": "o/r"},
+             "pull_request": {"number": 1, "head": {"sha": sha}}}
+            for sha in ("sha1", "sha2")
+        ]
+        old, new = [queue.submit(jobs.Job("pull_request", payload, {})) for payload in payloads]
+        assert coalesce.is_superseded(("o/r", 1), old.id)
+        assert coalesce.is_stale("o/r", 1, "sha1")
+        assert not coalesce.is_stale("o/r", 1, "sha2")
+
+        queue.run(new)
+        handler.assert_called_once_with(new)
+        assert not coalesce.is_stale("o/r", 1, "sha1")
+
+    def test_coalesce_register_before_get(self, backend, mocker):
+        queue = jobs.JobQueue(backend, workers=0)
+        # Number of jobs a worker could get when the job is registered
+        available = []
+        mocker.patch("pep8speaks.coalesce.register", side_effect=lambda *args: available.append(len(backend)))
+        payload = {"action": "opened", "repository": {"full_name": "o/r"},
+                   "pull_request": {"number": 3, "head": {"sha": "sha1"}}}
+        queue.submit(jobs.Job("pull_request", payload, {}))
+        assert available == [0]
+        assert len(backend) == 1
+
+    def test_coalesce_label_after_push(self, mocker):
+        mocker.patch("pep8speaks.handlers.handle_pull_request")
+        queue = jobs.JobQueue(jobs.MemoryQueue(), workers=0)
+        payloads = [
+            {"action": action, "repository": {"full_name": "o/r"},
+             "pull_request": {"number": 2, "head": {"sha": "sha1"}}}
+            for action in ("synchronize", "labeled")
+        ]
+        push, label = [queue.submit(jobs.Job("pull_request", payload, {})) for payload in payloads]
+        assert label.key is None
+        assert not coalesce.is_superseded(("o/r", 2), push.id)
+        queue.run(push)
+
+    def test_sqlite_coalesce(self, tmp_path):
+        backend = jobs.SQLiteQueue(str(tmp_path / "jobs.sqlite3"))
+        payload = {"action": "synchronize", "repository": {"full_name": "o/r"}, "pull_request": {"number": 1}}
+        backend.put(jobs.Job("pull_request", payload, {}))
+        backend.put(jobs.Job("issue_comment", {}, {}))
+        newest = jobs.Job("pull_request", payload, {})
+        backend.put(newest)
+        assert len(backend) == 2
+        assert backend.get(timeout=0).event == "issue_comment"
+        assert backend.get(timeout=0).id == newest.id
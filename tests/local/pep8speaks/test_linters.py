@@ -0,0 +1,127 @@
+import os
+
+import pytest
+from pep8speaks import linters
+from pep8speaks.models import LintIssue
+
+SOURCE = "import os,sys\ndef f( a ):\n    return a\n"
+
+
+class TestLinters:
+    @pytest.mark.parametrize('linter', ["pycodestyle", "flake8"])
+    def test_lint_inprocess(self, config, linter):
+        config["scanner"]["linter"] = linter
+        relevant, extra = linters.lint("pkg/module.py", SOURCE, config)
+        codes = [issue.code for issue in relevant]
+        assert "E401" in codes
+        assert "E231" in codes
+        assert LintIssue("pkg/module.py", 2, 1, "E302", "expected 2 blank lines, found 0") in relevant
+
+    @pytest.mark.parametrize('linter', ["pycodestyle", "flake8"])
+    def test_lint_ignore(self, config, linter):
+        config["scanner"]["linter"] = linter
+        config[linter]["ignore"] = ["E231", "E302"]
+        relevant, _ = linters.lint("module.py", SOURCE, config)
+        codes = [issue.code for issue in relevant]
+        assert "E231" not in codes
+        assert "E302" not in codes
+        assert "E401" in codes
+
+    def test_lint_after_fix(self, config):
+        source = (
+            "class A:\n"
+            "    \"\"\"Docstring\"\"\"\n"
+            "    def f(self):\n"
+            "        def g():\n"
+            "            return [1,\n"
+            "                2]\n"
+            "\n"
+            "\n"
+            "\n"
+            "        return g\n"
+        )
+        # Importing autopep8 must not change the checks of pycodestyle
+        linters.fix("module.py", source)
+        inprocess, _ = linters.lint("module.py", source, config)
+        config["scanner"]["engine"] = "subprocess"
+        cli, _ = linters.lint("module.py", source, config)
+        assert inprocess == cli
+        assert "E301" not in [issue.code for issue in inprocess]
+
+    def test_flake8_isolated(self, config, tmp_path, monkeypatch):
+        # The configuration files of the working directory are not read
+        (tmp_path / "setup.cfg").write_text("[flake8]\nignore = E303\n")
+        monkeypatch.chdir(tmp_path)
+        monkeypatch.setattr(linters._local, "guides", {})
+        config["scanner"]["linter"] = "flake8"
+        relevant, _ = linters.lint("module.py", "x = 1\n\n\n\ny = 2\n", config)
+        assert [issue.code for issue in relevant] == ["E303"]
+
+    def test_flake8_statistics(self, config):
+        config["scanner"]["linter"] = "flake8"
+        linters.lint("module.py", SOURCE, config)
+        application = linters._style_guide("flake8", linters.linter_options(config, "flake8"))
+        statistics = list(application.guide.stats.statistics_for(""))
+        linters.lint("module.py", SOURCE, config)
+        application = linters._style_guide("flake8", linters.linter_options(config, "flake8"))
+        assert len(list(application.guide.stats.statistics_for(""))) == len(statistics)
+
+    def test_linter_options(self, config):
+        config["pycodestyle"]["max-line-length"] = 100
+        config["pycodestyle"]["first"] = True
+        options = linters.linter_options(config, "pycodestyle")
+        assert options == {"max_line_length": 100, "repeat": False}
+
+    def test_lint_issue_str(self):
+        issue = LintIssue("pkg/module.py", 2, 1, "E302", "expected 2 blank lines, found 0")
+        assert str(issue) == "pkg/module.py:2:1: E302 expected 2 blank lines, found 0"
+
+    @pytest.mark.parametrize('linter', ["pycodestyle", "flake8"])
+    def test_lint_subprocess(self, config, linter):
+        config["scanner"]["linter"] = linter
+        config["scanner"]["engine"] = "subprocess"
+        relevant, _ = linters.lint("pkg/module.py", SOURCE, config)
+        assert LintIssue("pkg/module.py", 2, 1, "E302", "expected 2 blank lines, found 0") in relevant
+        assert not os.path.exists("pkg/module.py")
+
+    @pytest.mark.parametrize('linter', ["pycodestyle", "flake8"])
+    def test_lint_subprocess_dash_filename(self, config, linter, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        config["scanner"]["linter"] = linter
+        config["scanner"]["engine"] = "subprocess"
+        filename = f"--output-file={tmp_path / 'output.txt'}"
+        relevant, _ = linters.lint(filename, SOURCE, config)
+        assert LintIssue(filename, 2, 1, "E302", "expected 2 blank lines, found 0") in relevant
+        assert not (tmp_path / "output.txt").exists()
+
+    @pytest.mark.parametrize('linter', ["pycodestyle", "flake8"])
+    def test_lint_batch(self, config, linter):
+        config["scanner"]["linter"] = linter
+        config["scanner"]["engine"] = "subprocess"
+        files = [("pkg/module.py", SOURCE, "utf-8"), ("clean.py", "x = 1\n", "utf-8")]
+        results = linters.lint_batch(files, config)
+        assert set(results) == {"pkg/module.py", "clean.py"}
+        assert results["pkg/module.py"] == linters.lint("pkg/module.py", SOURCE, config)
+        assert results["clean.py"] == ([], [])
+
+    def test_fix(self):
+        fixed, diff = linters.fix("pkg/module.py", "import os,sys\n")
+        assert fixed == "import os\nimport sys\n"
+        assert diff == (
+            "--- original/pkg/module.py\n+++ fixed/pkg/module.py\n"
+            "@@ -1 +1,2 @@\n-import os,sys\n+import os\n+import sys\n"
+        )
+        assert linters.fix("module.py", "x = 1\n") == ("x = 1\n", "")
+
+    def test_fix_options(self, config):
+        config["pycodestyle"]["ignore"] = ["E401"]
+        config["pycodestyle"]["max-line-length"] = 100
+        options = linters.fix_options(config)
+        assert options == {"max_line_length": 100, "ignore": ["E401"]}
+        # E401 is not fixed, the long line is not wrapped
+        line = "x = [" + "1, " * 30 + "1]\n"
+        fixed, _ = linters.fix("module.py", "import os,sys\n" + line, options)
+        assert fixed == "import os, sys\n" + line
+
+        _, diff = linters.fix("module.py", "x=1")
+        assert diff.endswith("-x=1\n\\ No newline at end of file\n+x = 1\n")
@@ -0,0 +1,73 @@
+import os
+
+import pytest
+from pep8speaks import metrics
+
+
+@pytest.fixture(autouse=True)
+def clean_metrics():
+    metrics.reset()
+    yield
+    metrics.reset()
+
+
+class TestMetrics:
+    def test_render(self):
+        metrics.inc("jobs_total", event="pull_request", outcome="done")
+        metrics.inc("cache_requests_total", cache="lint", result="hit", value=3)
+        metrics.inc("cache_requests_total", cache="lint", result="miss")
+        metrics.set_gauge("job_queue_depth", 2)
+        metrics.observe("job_run_seconds", 0.3, event="pull_request")
+        metrics.observe("job_run_seconds", 400, event="pull_request")
+        metrics.inc("escaped_total", label='a"b\\c\nd')
+
+        lines = metrics.render(metrics.snapshot()).splitlines()
+        assert "# TYPE jobs_total counter" in lines
+        assert 'jobs_total{event="pull_request",outcome="done"} 1' in lines
+        assert 'cache_hit_ratio{cache="lint"} 0.75' in lines
+        assert "job_queue_depth 2" in lines
+        assert "# TYPE job_run_seconds histogram" in lines
+        assert 'job_run_seconds_bucket{event="pull_request",le="0.25"} 0' in lines
+        assert 'job_run_seconds_bucket{event="pull_request",le="0.5"} 1' in lines
+        assert 'job_run_seconds_bucket{event="pull_request",le="300.0"} 1' in lines
+        assert 'job_run_seconds_bucket{event="pull_request",le="+Inf"} 2' in lines
+        assert 'job_run_seconds_sum{event="pull_request"} 400.3' in lines
+        assert 'job_run_seconds_count{event="pull_request"} 2' in lines
+        assert 'escaped_total{label="a\\"b\\\\c\\nd"} 1' in lines
+
+    def test_timer(self):
+        @metrics.timer("stage_seconds", stage="lint")
+        def lint():
+            pass
+
+        lint()
+        with pytest.raises(ValueError):
+            with metrics.timer("stage_seconds", stage="lint"):
+                raise ValueError
+        assert metrics.snapshot()["histograms"]["stage_seconds", (("stage", "lint"), )]["count"] == 2
+
+    def test_collect(self, tmp_path):
+        directory = str(tmp_path)
+        metrics.inc("jobs_total", event="pull_request")
+        metrics.set_gauge("job_queue_depth", 1)
+        metrics.observe("job_run_seconds", 1)
+        metrics.write_snapshot(directory)
+        os.rename(tmp_path / f"{os.getpid()}.json", tmp_path / "1.json")
+
+        metrics.set_gauge("job_queue_depth", 3)
+        merged = metrics.collect(directory)
+        assert merged["counters"]["jobs_total", (("event", "pull_request"), )] == 2
+        assert merged["gauges"]["job_queue_depth", (("pid", "1"), )] == 1
+        assert merged["gauges"]["job_queue_depth", (("pid", str(os.getpid())), )] == 3
+        assert merged["histograms"]["job_run_seconds", ()]["count"] == 2
+
+        # The counters of an exited process are kept, not its gauges
+        metrics.mark_process_dead(1, directory)
+        assert sorted(os.listdir(directory)) == sorted([f"{os.getpid()}.json", "dead.json"])
+        merged = metrics.collect(directory)
+        assert merged["counters"]["jobs_total", (("event", "pull_request"), )] == 2
+        assert [key for key in merged["gauges"] if key[0] == "job_queue_depth"] == [
+            ("job_queue_depth", (("pid", str(os.getpid())), ))]
+
+        metrics.clear_directory(directory)
+        assert os.listdir(directory) == []
@@ -0,0 +1,24 @@
+import os
+
+import pytest
+from pep8speaks import scratch
+
+
+class TestScratch:
+    def test_write(self):
+        with scratch.directory() as tmpdir:
+            path = scratch.write(tmpdir, "pkg/module.py", "import os\n")
+            assert path == os.path.join(tmpdir, "pkg", "module.py")
+            with open(path) as scratch_file:
+                assert scratch_file.read() == "import os\n"
+        assert not os.path.exists(tmpdir)
+
+    def test_directories_are_separate(self):
+        with scratch.directory() as first, scratch.directory() as second:
+            assert first != second
+
+    @pytest.mark.parametrize('filename', ["../module.py", "/etc/module.py"])
+    def test_write_outside(self, filename):
+        with scratch.directory() as tmpdir:
+            with pytest.raises(ValueError):
+                scratch.write(tmpdir, filename, "")
@@ -1,28 +1,29 @@
 import hmac
-import os
 import pytest
 import werkzeug
 import mock
 from pep8speaks.utils import update_dict, match_webhook_secret, query_request
-from pep8speaks.constants import BASE_URL
+from pep8speaks.constants import BASE_URL, GITHUB_TOKEN, HTTP_TIMEOUT
 
 
 class TestUtils:
     @pytest.mark.parametrize('query, method, json, data, headers, params', [
         ('/someurl', 'POST', {'k1': 'v1'}, '', None, None),
-        ('http://someurl.com', 'GET', None, '', 'h1=v1', 'k1=v1'),
+        ('http://someurl.com', 'GET', None, '', {'h1': 'v1'}, {'k1': 'v1'}),
     ])
     def test_request(self, mocker, query, method, json, data, headers, params):
-        mock_func = mock.MagicMock(return_value=True)
-        mocker.patch('requests.request', mock_func)
+        mock_func = mock.MagicMock(return_value=mock.MagicMock(status_code=200, headers={}))
+        mocker.patch('pep8speaks.client.get_session', return_value=mock.MagicMock(request=mock_func))
         query_request(query, method, json=json, data=data,
                       headers=headers, params=params)
         assert mock_func.call_count == 1
         assert mock_func.call_args[0][0] == method
-        assert mock_func.call_args[1]['headers'] == headers
-        assert mock_func.call_args[1]['auth'] == (os.environ['BOT_USERNAME'], os.environ['GITHUB_TOKEN'])
+        assert mock_func.call_args[1]['headers'] == {
+            "Authorization": f"Bearer {GITHUB_TOKEN}", **(headers or {})}
         assert mock_func.call_args[1]['params'] == params
         assert mock_func.call_args[1]['json'] == json
+        assert mock_func.call_args[1]['data'] == data
+        assert mock_func.call_args[1]['timeout'] == HTTP_TIMEOUT
         if query[0] == "/":
             assert mock_func.call_args[0][1] == BASE_URL + query
         else:
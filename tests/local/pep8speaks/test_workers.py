@@ -0,0 +1,39 @@
+import math
+import os
+import time
+
+import pytest
+from pep8speaks import linters, workers
+
+
+@pytest.fixture
+def pool():
+    pool = workers.Pool(size=2, max_jobs=2, timeout=5)
+    yield pool
+    pool.close()
+
+
+class TestWorkers:
+    def test_map(self, pool):
+        assert pool.map(math.sqrt, [(4, ), (9, ), (16, )]) == [2, 3, 4]
+
+    def test_fix(self, pool):
+        fixed, _ = pool.apply(linters.fix, "module.py", "import os,sys\n", {"max_line_length": 79})
+        assert fixed == "import os\nimport sys\n"
+
+    def test_exception(self, pool):
+        with pytest.raises(ValueError):
+            pool.apply(math.sqrt, -1)
+        assert pool.apply(math.sqrt, 4) == 2
+
+    def test_recycle(self, pool):
+        pids = [pool.apply(os.getpid) for _ in range(6)]
+        assert os.getpid() not in pids
+        # Two workers, replaced after two jobs
+        assert len(set(pids)) >= 3
+
+    def test_timeout(self, pool):
+        pool.timeout = 0.5
+        with pytest.raises(workers.WorkerTimeout):
+            pool.apply(time.sleep, 10)
+        assert pool.apply(math.sqrt, 4) == 2
@@ -27,3 +27,27 @@ class TestApp:
         client.post(url_for('main'),
                     headers={"X-GitHub-Event": event})
         assert mock_func.call_count == 2
+
+    @pytest.mark.parametrize('event', ["pull_request", "issue_comment"])
+    def test_main_post_queued(self, mocker, client, event):
+        mocker.patch('pep8speaks.utils.match_webhook_secret', mock.MagicMock(return_value=True))
+        enqueue = mock.MagicMock()
+        enqueue.return_value.id = 1
+        mocker.patch('pep8speaks.jobs.enqueue', enqueue)
+        response = client.post(url_for('main'), json={}, headers={"X-GitHub-Event": event})
+        assert response.status_code == 202
+        assert enqueue.call_count == 1
+
+    def test_metrics(self, mocker, client):
+        mocker.patch('pep8speaks.utils.match_webhook_secret', mock.MagicMock(return_value=True))
+        enqueue = mock.MagicMock()
+        enqueue.return_value.id = 1
+        mocker.patch('pep8speaks.jobs.enqueue', enqueue)
+        client.post(url_for('main'), json={}, headers={"X-GitHub-Event": "pull_request"})
+
+        response = client.get(url_for('metrics_endpoint'))
+        assert response.status_code == 200
+        assert response.mimetype == "text/plain"
+        text = response.get_data(as_text=True)
+        assert 'webhook_requests_total{event="pull_request",status="202"}' in text
+        assert 'webhook_request_seconds_count{event="pull_request"}' in text